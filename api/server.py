@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import json
+from systemd import journal
+
+BATTERY_KEYS = ['battery_power', 'battery_voltage', 'battery_load', 'battery_charging', 'battery_time_to_empty']
+
+PAGE = b"""<!doctype html>
+<html><head><meta name="viewport" content="width=device-width"><title>RPiNT</title></head>
+<body style="font-family:monospace"><h3>RPiNT</h3><pre id="state">connecting...</pre>
+<script>
+new EventSource('/api/events').addEventListener('state', e => {
+  document.getElementById('state').textContent = JSON.stringify(JSON.parse(e.data), null, 2);
+});
+</script></body></html>
+"""
+
+STATUS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+          503: 'Service Unavailable'}
+
+class StateHub:
+    """Current LLDP and UPS state as JSON, with an ETag per version.
+
+    While SSE clients are connected, Redis is checked every `interval`
+    seconds (the version keys plus the battery keys, one round trip); the
+    full snapshot is only rebuilt when that changed, and then pushed to
+    every client. With no clients connected nothing is polled. The Redis
+    reads run on a worker thread so they never hold up the event loop.
+    The cumulative per-profile seconds of the `power` hash are left out,
+    so an idle device keeps its ETag.
+    """
+    def __init__(self, redis_db, interval=1.0):
+        self.redis_db = redis_db
+        self.interval = interval
+        self.clients = 0
+        self.marker = None
+        self.state = None
+        self.body = b''
+        self.etag = None
+        self._changed = asyncio.Event()
+        self._has_clients = asyncio.Event()
+        self._polling = asyncio.Lock()
+
+    async def poll(self):
+        async with self._polling:
+            marker, state = await asyncio.get_running_loop().run_in_executor(None, self.read, self.marker)
+            if state is None:
+                return False
+            self.marker = marker
+            self.publish(state)
+            return True
+
+    def read(self, marker):
+        """(marker, state) from Redis, state None if the marker is unchanged; blocking."""
+        pipe = self.redis_db.pipeline()
+        pipe.get('LLDP_version')
+        pipe.get('link_state')
+        pipe.get('linktest_version')
+        pipe.get('power_version')
+        pipe.mget(BATTERY_KEYS)
+        current = json.dumps(pipe.execute())
+        if current == marker:
+            return current, None
+        return current, self.snapshot()
+
+    def snapshot(self):
+        redis_db = self.redis_db
+        neighbor_keys = sorted(redis_db.smembers('LLDP:neighbors'))
+        pipe = redis_db.pipeline()
+        pipe.hgetall('LLDP')
+        pipe.get('LLDP_version')
+        pipe.get('link_state')
+        pipe.mget(BATTERY_KEYS)
+        pipe.hgetall('power')
+        pipe.hgetall('linktest')
+        for key in neighbor_keys:
+            pipe.hgetall(key)
+        lldp, version, link_state, battery, power, linktest, *neighbors = pipe.execute()
+        return {
+            'version': version,
+            'link_state': link_state,
+            'lldp': lldp,
+            'neighbors': neighbors,
+            'battery': dict(zip(BATTERY_KEYS, battery)),
+            'power': {k: v for k, v in power.items() if not k.endswith('_s')},
+            'linktest': linktest,
+        }
+
+    def publish(self, state):
+        self.state = state
+        self.body = json.dumps(state, separators=(',', ':')).encode()
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest()[:16] + '"'
+        old, self._changed = self._changed, asyncio.Event()
+        old.set()
+
+    async def run(self):
+        while True:
+            await self._has_clients.wait()
+            try:
+                await self.poll()
+            except Exception as e:
+                journal.send(f"HTTP API state poll failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def subscribe(self):
+        self.clients += 1
+        self._has_clients.set()
+
+    def unsubscribe(self):
+        self.clients -= 1
+        if not self.clients:
+            self._has_clients.clear()
+
+    def changed(self):
+        return self._changed
+
+    async def ready(self, force=False):
+        """Poll if needed; False when Redis could not be read."""
+        if force or self.state is None:
+            try:
+                await self.poll()
+            except Exception as e:
+                journal.send(f"HTTP API state poll failed: {e}")
+                return False
+        return self.state is not None
+
+class ApiServer:
+    """Small HTTP/1.1 server on asyncio streams.
+
+    GET /api/state, /api/lldp and /api/battery return JSON with an ETag
+    and answer If-None-Match with 304. GET /api/events is a Server-Sent
+    Events stream that pushes the state on every change, with a comment
+    line every `keepalive` seconds. Every response closes the connection
+    except the event stream.
+    """
+    def __init__(self, hub, host='0.0.0.0', port=8080, max_clients=32, keepalive=15):
+        self.hub = hub
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.keepalive = keepalive
+        self.connections = 0
+        self.handlers = set()
+        self.streams = set()
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=8192)
+        self.port = self.server.sockets[0].getsockname()[1]
+        journal.send(f"HTTP API listening on {self.host}:{self.port}")
+
+    async def serve(self):
+        await self.start()
+        try:
+            await asyncio.gather(self.server.serve_forever(), self.hub.run())
+        finally:
+            await self.close()
+
+    async def close(self):
+        self.server.close()
+        for writer in self.streams:
+            writer.close()
+        if self.handlers:
+            await asyncio.wait(self.handlers, timeout=1)
+
+    async def handle(self, reader, writer):
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        self.connections += 1
+        try:
+            request = await asyncio.wait_for(self.read_request(reader), 10)
+            if request is None:
+                await self.respond(writer, 400)
+            elif self.connections > self.max_clients:
+                await self.respond(writer, 503)
+            else:
+                await self.route(reader, writer, *request)
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self.connections -= 1
+            self.handlers.discard(task)
+            writer.close()
+
+    async def read_request(self, reader):
+        line = await reader.readline()
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3:
+            return None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+            if len(headers) > 50:
+                return None
+        method, path, _ = parts
+        return method, path.split('?', 1)[0], headers
+
+    async def route(self, reader, writer, method, path, headers):
+        if method not in ('GET', 'HEAD'):
+            await self.respond(writer, 405, extra={'Allow': 'GET, HEAD'})
+            return
+        if path == '/':
+            await self.respond(writer, 200, PAGE, 'text/html; charset=utf-8', head=method == 'HEAD')
+            return
+        if path == '/api/events':
+            await self.events(reader, writer, headers)
+            return
+        if path not in ('/api/state', '/api/lldp', '/api/battery'):
+            await self.respond(writer, 404)
+            return
+        hub = self.hub
+        if not await hub.ready(force=not hub.clients):
+            await self.respond(writer, 503, b'state unavailable\n')
+            return
+        if path == '/api/state':
+            body, etag = hub.body, hub.etag
+        else:
+            part = hub.state['lldp' if path == '/api/lldp' else 'battery']
+            body = json.dumps(part, separators=(',', ':')).encode()
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        if etag in headers.get('if-none-match', ''):
+            await self.respond(writer, 304, extra={'ETag': etag})
+            return
+        await self.respond(writer, 200, body, 'application/json', extra={'ETag': etag, 'Cache-Control': 'no-cache'},
+                           head=method == 'HEAD')
+
+    async def respond(self, writer, status, body=b'', content_type='text/plain', extra=None, head=False):
+        lines = [f'HTTP/1.1 {status} {STATUS[status]}', 'Connection: close']
+        if status != 304:
+            lines += [f'Content-Type: {content_type}', f'Content-Length: {len(body)}']
+        lines += [f'{k}: {v}' for k, v in (extra or {}).items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if body and not head and status != 304:
+            writer.write(body)
+        await writer.drain()
+
+    async def events(self, reader, writer, headers):
+        hub = self.hub
+        if not await hub.ready():
+            await self.respond(writer, 503, b'state unavailable\n')
+            return
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                     b'Connection: keep-alive\r\nX-Accel-Buffering: no\r\n\r\n')
+        hub.subscribe()
+        self.streams.add(writer)
+        # the client never sends anything after the request, so EOF here means it went away
+        gone = asyncio.ensure_future(reader.read())
+        try:
+            sent = headers.get('last-event-id')
+            changed = True
+            while True:
+                if hub.etag != sent:
+                    sent = hub.etag
+                    writer.write(b'id: ' + sent.encode() + b'\nevent: state\ndata: ' + hub.body + b'\n\n')
+                elif not changed:
+                    writer.write(b': keepalive\n\n')
+                await writer.drain()
+                waiter = asyncio.ensure_future(hub.changed().wait())
+                done, _ = await asyncio.wait((waiter, gone), timeout=self.keepalive,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if gone in done:
+                    break
+                changed = waiter in done
+        finally:
+            gone.cancel()
+            self.streams.discard(writer)
+            hub.unsubscribe()
@@ -0,0 +1,179 @@
+import json
+import os
+import subprocess
+import threading
+
+from power.fake_smbus import FakeSMBus
+from power.telemetry import DISCHARGE_CURVE
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, f'{name}.json')) as file:
+        return file.read()
+
+def fixture_names():
+    return sorted(f[:-5] for f in os.listdir(FIXTURES_DIR) if f.endswith('.json'))
+
+def scaled_fixture(neighbors, template='cisco_c2960x', interfaces=4):
+    """An lldpcli document with `neighbors` copies of one recorded neighbor."""
+    document = json.loads(load_fixture(template))
+    base = document['lldp']['interface']['eth0']
+    entries = []
+    for i in range(neighbors):
+        neighbor = json.loads(json.dumps(base))
+        chassis = next(iter(neighbor['chassis'].values()))
+        chassis['id']['value'] = f"02:00:00:00:{i >> 8:02x}:{i & 0xFF:02x}"
+        neighbor['port']['id']['value'] = f"Gi1/0/{i + 1}"
+        entries.append({f"eth{i % interfaces}": neighbor})
+    return json.dumps({'lldp': {'interface': entries}})
+
+class FixtureRunner:
+    """command_runner for lldp_neighbors() that returns canned lldpcli output."""
+    def __init__(self, output):
+        self.output = output
+        self.calls = 0
+
+    def __call__(self, command, **kwargs):
+        self.calls += 1
+        return subprocess.CompletedProcess(command, 0, stdout=self.output, stderr='')
+
+class FakeRedis:
+    """Dict-backed stand-in for the redis commands RPiNT uses; counts ops."""
+    def __init__(self):
+        self.data = {}
+        self.ops = 0
+        self.published = []
+        self.lock = threading.Lock()
+
+    def _op(self):
+        self.ops += 1
+
+    def ping(self):
+        self._op()
+        return True
+
+    def flushdb(self):
+        self._op()
+        self.data.clear()
+
+    def get(self, key):
+        self._op()
+        value = self.data.get(key)
+        return None if value is None else str(value)
+
+    def mget(self, keys):
+        self._op()
+        return [None if self.data.get(key) is None else str(self.data[key]) for key in keys]
+
+    def set(self, key, value):
+        self._op()
+        self.data[key] = str(value)
+
+    def incr(self, key):
+        self._op()
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def delete(self, *keys):
+        self._op()
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def hset(self, key, mapping):
+        self._op()
+        self.data.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+
+    def hget(self, key, field):
+        self._op()
+        return self.data.get(key, {}).get(field)
+
+    def hgetall(self, key):
+        self._op()
+        return dict(self.data.get(key, {}))
+
+    def sadd(self, key, *members):
+        self._op()
+        self.data.setdefault(key, set()).update(members)
+
+    def srem(self, key, *members):
+        self._op()
+        self.data.get(key, set()).difference_update(members)
+
+    def smembers(self, key):
+        self._op()
+        return set(self.data.get(key, set()))
+
+    def publish(self, channel, message):
+        self._op()
+        self.published.append((channel, message))
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+class FakePipeline:
+    def __init__(self, redis_db):
+        self.redis_db = redis_db
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self.redis_db.lock:
+            results = [getattr(self.redis_db, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+class FakeButton:
+    """gpiozero.Button stand-in; press() runs the when_pressed callback."""
+    def __init__(self, pin=None, hold_time=1):
+        self.pin = pin
+        self.when_pressed = None
+        self.when_held = None
+
+    def press(self):
+        if self.when_pressed:
+            self.when_pressed()
+
+class SimulatedBattery(FakeSMBus):
+    """FakeSMBus whose INA219 registers follow a draining Li-ion cell."""
+    def __init__(self, capacity_Wh=3.7, charge=100.0, load_W=1.0):
+        super().__init__()
+        self.capacity_Wh = capacity_Wh
+        self.charge = charge
+        self.load_W = load_W
+        self._update_registers()
+
+    def step(self, seconds):
+        used = self.load_W * seconds / 3600
+        self.charge = max(0.0, self.charge - used / self.capacity_Wh * 100)
+        self._update_registers()
+
+    @property
+    def voltage(self):
+        for (v0, c0), (v1, c1) in zip(DISCHARGE_CURVE, DISCHARGE_CURVE[1:]):
+            if self.charge <= c1:
+                return v0 + (v1 - v0) * (self.charge - c0) / (c1 - c0)
+        return DISCHARGE_CURVE[-1][0]
+
+    def _update_registers(self):
+        voltage = self.voltage
+        current_mA = -self.load_W / voltage * 1000
+        self.registers[0x02] = int(voltage / 0.004) << 3
+        self.registers[0x01] = int(current_mA * 0.1 / 0.01) & 0xFFFF
+        self.registers[0x04] = int(current_mA) & 0xFFFF
+        self.registers[0x03] = int(self.load_W / 0.002) & 0xFFFF
+
+    def write_i2c_block_data(self, addr, register, data):
+        super().write_i2c_block_data(addr, register, data)
+        self._update_registers()
+
+def dummy_display(width=128, height=128, partial_update=True):
+    """Headless luma dummy device, optionally behind PartialUpdateDisplay."""
+    from luma.core.device import dummy
+    from display.framebuffer import PartialUpdateDisplay
+    device = dummy(width=width, height=height, mode='RGB')
+    return PartialUpdateDisplay(device) if partial_update else device
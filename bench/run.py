@@ -0,0 +1,199 @@
+"""Offline benchmarks: python3 -m bench.run [--out results.json]"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import threading
+from time import perf_counter, process_time, sleep
+
+from app_context import AppContext
+from lldp.lldp import lldp_neighbors, LLDPChangeTracker
+from bench.fakes import (FakeRedis, FixtureRunner, fixture_names, load_fixture, scaled_fixture,
+                         dummy_display)
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts', 'FreePixel.ttf')
+
+def default_config():
+    from utils.config import config_load
+    path = os.path.join(os.path.dirname(FONT_PATH), '..', 'rpint.toml')
+    return config_load(path)['setup']
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'n': len(samples),
+        'mean_us': round(statistics.fmean(samples) * 1e6, 1),
+        'p50_us': round(samples[len(samples) // 2] * 1e6, 1),
+        'p95_us': round(samples[int(len(samples) * 0.95) - 1] * 1e6, 1),
+        'max_us': round(samples[-1] * 1e6, 1),
+    }
+
+def bench_parse(iterations):
+    documents = {name: load_fixture(name) for name in fixture_names()}
+    for size in (10, 50, 200):
+        documents[f'scaled_{size}'] = scaled_fixture(size)
+    results = {}
+    for name, document in documents.items():
+        runner = FixtureRunner(document)
+        timings = []
+        for _ in range(iterations):
+            start = perf_counter()
+            neighbors = lldp_neighbors(runner)
+            timings.append(perf_counter() - start)
+        results[name] = dict(summarize(timings), neighbors=len(neighbors), bytes=len(document))
+    return results
+
+def make_controller(config, redis_db):
+    from display.controller import DisplayController
+    context = AppContext(config, FONT_PATH, redis_db, threading.Event())
+    controller = DisplayController(context)
+    controller.db = redis_db
+    return controller
+
+def bench_render(config, iterations):
+    results = {}
+    for name in ('cisco_c2960x', 'mikrotik_multi'):
+        for partial in (False, True):
+            redis_db = FakeRedis()
+            LLDPChangeTracker(redis_db).update_neighbors(lldp_neighbors(FixtureRunner(load_fixture(name))))
+            redis_db.set('battery_power', 87)
+            controller = make_controller(config, redis_db)
+            device = dummy_display(config.get('serial_display_width', 128),
+                                   config.get('serial_display_height', 128), partial)
+            timings = []
+            redis_db.ops = 0
+            for i in range(iterations):
+                if i % 10 == 0:
+                    controller.update_scroll_y_down()
+                start = perf_counter()
+                controller.render_frame(device)
+                timings.append(perf_counter() - start)
+            result = dict(summarize(timings), redis_ops_per_frame=round(redis_db.ops / iterations, 2))
+            if partial:
+                result['spi_bytes_per_frame'] = round(device.bytes_sent / iterations)
+                result['frames_skipped'] = device.frames_skipped
+            results[f"{name}{'_partial' if partial else ''}"] = result
+    return results
+
+def bench_redis(iterations, unix_socket=None):
+    """Tracker writes per second; against real Redis when a socket is given."""
+    if unix_socket:
+        from utils.redis_utils import db_connect
+        redis_db = db_connect('localhost', 15, unix_socket)
+        redis_db.flushdb()
+    else:
+        redis_db = FakeRedis()
+    documents = [lldp_neighbors(FixtureRunner(load_fixture(name))) for name in ('cisco_c2960x', 'juniper_ex2300', 'empty')]
+    tracker = LLDPChangeTracker(redis_db)
+    start = perf_counter()
+    for i in range(iterations):
+        tracker.update_neighbors(documents[i % len(documents)])
+        redis_db.get('LLDP_version')
+        redis_db.hgetall('LLDP')
+    elapsed = perf_counter() - start
+    result = {'backend': 'redis' if unix_socket else 'fake', 'updates_per_second': round(iterations / elapsed)}
+    if not unix_socket:
+        result['ops_per_update'] = round(redis_db.ops / iterations, 2)
+        result['ops_per_second'] = round(redis_db.ops / elapsed)
+    else:
+        redis_db.flushdb()
+    return result
+
+def bench_cpu(config, seconds):
+    """CPU seconds per wall second of the display loop under a steady neighbor."""
+    redis_db = FakeRedis()
+    LLDPChangeTracker(redis_db).update_neighbors(lldp_neighbors(FixtureRunner(load_fixture('cisco_c2960x'))))
+    controller = make_controller(config, redis_db)
+    device = dummy_display(partial_update=config.get('serial_display_partial_update', True))
+    period = 1 / config.get('serial_display_refresh_rate', 5)
+    wall_start, cpu_start = perf_counter(), process_time()
+    frames = 0
+    while perf_counter() - wall_start < seconds:
+        controller.render_frame(device)
+        frames += 1
+        sleep(period)
+    wall = perf_counter() - wall_start
+    return {'frames': frames, 'cpu_per_wall_second': round((process_time() - cpu_start) / wall, 4)}
+
+def bench_api(seconds, clients=16, iterations=200):
+    """HTTP API: GET and conditional GET latency, and idle CPU with and without SSE clients."""
+    import asyncio
+    from api.server import StateHub, ApiServer
+
+    async def request(port, path, etag=None):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        headers = f'If-None-Match: {etag}\r\n' if etag else ''
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: bench\r\n{headers}\r\n'.encode())
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def idle(port):
+        wall_start, cpu_start = perf_counter(), process_time()
+        await asyncio.sleep(seconds)
+        return round((process_time() - cpu_start) / (perf_counter() - wall_start), 4)
+
+    async def run():
+        redis_db = FakeRedis()
+        LLDPChangeTracker(redis_db).update_neighbors(lldp_neighbors(FixtureRunner(load_fixture('cisco_c2960x'))))
+        redis_db.set('battery_power', 80)
+        server = ApiServer(StateHub(redis_db), host='127.0.0.1', port=0, max_clients=clients + 4)
+        await server.start()
+        hub_task = asyncio.ensure_future(server.hub.run())
+        result = {}
+        for name, etag in (('get', None), ('get_304', server.hub.etag)):
+            samples = []
+            for _ in range(iterations):
+                start = perf_counter()
+                await request(server.port, '/api/state', etag)
+                samples.append(perf_counter() - start)
+            result[name] = summarize(samples)
+        result['idle_cpu_per_wall_second'] = await idle(server.port)
+        streams = [await asyncio.open_connection('127.0.0.1', server.port) for _ in range(clients)]
+        for _, writer in streams:
+            writer.write(b'GET /api/events HTTP/1.1\r\nHost: bench\r\n\r\n')
+        for reader, _ in streams:
+            await reader.readuntil(b'\n\n')
+            await reader.readuntil(b'\n\n')
+        result['sse_clients'] = clients
+        result['sse_idle_cpu_per_wall_second'] = await idle(server.port)
+        start = perf_counter()
+        redis_db.set('battery_power', 79)
+        for reader, _ in streams:
+            await reader.readuntil(b'\n\n')
+        result['sse_push_ms'] = round((perf_counter() - start) * 1000, 1)
+        for _, writer in streams:
+            writer.close()
+        hub_task.cancel()
+        await server.close()
+        return result
+
+    return asyncio.run(run())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--out', help='write results as JSON to this file')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--cpu-seconds', type=float, default=5)
+    parser.add_argument('--redis-socket', help='also measure against a real Redis on this Unix socket (uses db 15)')
+    args = parser.parse_args()
+    config = default_config()
+    results = {
+        'platform': {'machine': platform.machine(), 'python': platform.python_version()},
+        'parse': bench_parse(args.iterations),
+        'render': bench_render(config, args.iterations),
+        'redis': [bench_redis(args.iterations)],
+        'cpu': bench_cpu(config, args.cpu_seconds),
+        'api': bench_api(args.cpu_seconds, iterations=args.iterations),
+    }
+    if args.redis_socket:
+        results['redis'].append(bench_redis(args.iterations, args.redis_socket))
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as file:
+            file.write(output)
+    print(output)
+
+if __name__ == '__main__':
+    main()
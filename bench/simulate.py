@@ -0,0 +1,109 @@
+"""Replay a scripted session against the hardware fakes on a simulated clock.
+
+python3 -m bench.simulate bench/sessions/plug_and_drain.json [--speed 0] [--out results.json]
+"""
+import argparse
+import json
+from time import perf_counter, process_time, sleep
+
+from lldp.lldp import lldp_neighbors, LLDPChangeTracker
+from power.INA219 import INA219
+from power.telemetry import BatteryTelemetry
+from bench.fakes import FakeRedis, FakeButton, FixtureRunner, SimulatedBattery, load_fixture, dummy_display
+from bench.run import default_config, make_controller
+
+def simulate(session, config, speed=0):
+    """Run the session; speed is simulated seconds per wall second (0 = flat out)."""
+    tick = session.get('tick', 0.2)
+    lldp_interval = session.get('lldp_interval', 2)
+    frame_interval = 1 / config.get('serial_display_refresh_rate', 5)
+    redis_db = FakeRedis()
+    tracker = LLDPChangeTracker(redis_db)
+    battery = SimulatedBattery(**session.get('battery', {}))
+    ina219 = INA219(addr=0x43, bus=battery)
+    telemetry = BatteryTelemetry(battery_Wh=battery.capacity_Wh)
+    controller = make_controller(config, redis_db)
+    buttons = {name: FakeButton() for name in ('up', 'down', 'left', 'right', 'page')}
+    controller.bind_buttons(buttons['up'], buttons['down'], buttons['left'], buttons['right'], buttons['page'])
+    device = dummy_display(config.get('serial_display_width', 128), config.get('serial_display_height', 128),
+                           config.get('serial_display_partial_update', True))
+    events = sorted(session['events'], key=lambda e: e['t'])
+    runner = FixtureRunner(load_fixture('empty'))
+    carrier = False
+    timeline = []
+    next_lldp = next_frame = next_battery = 0.0
+    first_neighbor_at = plugged_at = None
+    now = 0.0
+    wall_start, cpu_start = perf_counter(), process_time()
+    while now < session['duration']:
+        while events and events[0]['t'] <= now:
+            event = events.pop(0)
+            if event['event'] == 'plug':
+                carrier, plugged_at, first_neighbor_at = True, now, None
+                next_lldp = now
+            elif event['event'] == 'unplug':
+                carrier = False
+                runner.output = load_fixture('empty')
+                tracker.update_neighbors([])
+            elif event['event'] == 'neighbors':
+                runner.output = load_fixture(event['fixture'])
+            elif event['event'] == 'press':
+                buttons[event['button']].press()
+            elif event['event'] == 'load':
+                battery.load_W = event['load_W']
+            timeline.append(dict(event, at=round(now, 2)))
+        if carrier and now >= next_lldp:
+            if tracker.update_neighbors(lldp_neighbors(runner)) and first_neighbor_at is None \
+                    and redis_db.smembers('LLDP:neighbors'):
+                first_neighbor_at = now
+                timeline.append({'t': round(now, 2), 'event': 'neighbor_shown',
+                                 'after_plug_s': round(now - plugged_at, 2)})
+            next_lldp = now + lldp_interval
+        if now >= next_battery:
+            battery.step(1)
+            sample = ina219.sample(triggered=True, sleep=lambda seconds: None)
+            telemetry.add(now, sample.bus_voltage_V, sample.power_W, sample.current_mA)
+            redis_db.set('battery_power', round(telemetry.charge))
+            next_battery = now + 1
+        if now >= next_frame:
+            controller.render_frame(device)
+            next_frame = now + frame_interval
+        now += tick
+        if speed:
+            sleep(tick / speed)
+    wall = perf_counter() - wall_start
+    time_to_empty = telemetry.time_to_empty()
+    return {
+        'simulated_s': round(now, 2),
+        'wall_s': round(wall, 3),
+        'speedup': round(now / wall, 1),
+        'cpu_per_wall_second': round((process_time() - cpu_start) / wall, 4),
+        'redis_ops': redis_db.ops,
+        'lldp_reads': runner.calls,
+        'i2c': {'reads': battery.reads, 'writes': battery.writes},
+        'display': {'frames_sent': getattr(device, 'frames_sent', None),
+                    'frames_skipped': getattr(device, 'frames_skipped', None),
+                    'spi_bytes': getattr(device, 'bytes_sent', None)},
+        'battery': {'true_charge': round(battery.charge, 1), 'estimated_charge': round(telemetry.charge, 1),
+                    'time_to_empty_min': None if time_to_empty is None else round(time_to_empty, 1),
+                    'true_time_to_empty_min': round(battery.capacity_Wh * battery.charge / 100 / battery.load_W * 60, 1)},
+        'timeline': timeline,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('session')
+    parser.add_argument('--speed', type=float, default=0, help='simulated seconds per wall second, 0 = as fast as possible')
+    parser.add_argument('--out', help='write results as JSON to this file')
+    args = parser.parse_args()
+    with open(args.session) as file:
+        session = json.load(file)
+    results = simulate(session, default_config(), args.speed)
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as file:
+            file.write(output)
+    print(output)
+
+if __name__ == '__main__':
+    main()
@@ -1,105 +1,261 @@
-from luma.core.interface.serial import spi
 from luma.core.render import canvas
-from luma.lcd.device import st7735
-from PIL import ImageFont
-from time import sleep
+from time import monotonic
+from utils.metrics import metrics
+from .framebuffer import PartialUpdateDisplay
+from .fonts import FontManager
+from .layout import VirtualCanvas
+from .plan import compile_plan
 
 class DisplayController:
-    def __init__(self, context, button_up, button_down, button_left, button_right):
+    def __init__(self, context, button_up=None, button_down=None, button_left=None, button_right=None, button_page=None, button_debug=None):
         self.context = context
+        self.db = None
+        self.device = None
         self.scroll_x = 0
         self.scroll_index = 0
         self.max_lines = 3
         self.data_lines = []
+        self.max_scroll_x = 0
+        self.lldp_version = -1
+        self.neighbor_keys = []
+        self.neighbor_index = 0
+        self.debug_page = False
+        self.bytes_per_second = None
+        self.stats_due = 0
+        self.cache_stats = False
+        self.asleep = False
+        self.fonts = FontManager()
+        self.layout = VirtualCanvas(self.fonts)
+        self.view_x = 0
+        self.view_y = 0
+        self.plan = compile_plan(context.config, context.font_path)
+        self.on_redraw = None
+        if button_up is not None:
+            self.bind_buttons(button_up, button_down, button_left, button_right, button_page, button_debug)
+
+    def bind_buttons(self, button_up, button_down, button_left, button_right, button_page=None, button_debug=None,
+                     dispatch=None):
+        """dispatch wraps each callback, e.g. Runtime.dispatch to run it on the event loop."""
+        dispatch = dispatch or (lambda callback: callback)
         self.button_up = button_up
         self.button_down = button_down
         self.button_left = button_left
         self.button_right = button_right
-        self.button_up.when_pressed = self.update_scroll_y_up
-        self.button_down.when_pressed = self.update_scroll_y_down
-        self.button_left.when_pressed = self.update_scroll_x_left
-        self.button_right.when_pressed = self.update_scroll_x_right
+        self.button_up.when_pressed = dispatch(self.update_scroll_y_up)
+        self.button_down.when_pressed = dispatch(self.update_scroll_y_down)
+        self.button_left.when_pressed = dispatch(self.update_scroll_x_left)
+        self.button_right.when_pressed = dispatch(self.update_scroll_x_right)
+        if button_page is not None:
+            button_page.when_pressed = dispatch(self.next_neighbor)
+        if button_debug is not None:
+            button_debug.when_pressed = dispatch(self.toggle_debug_page)
+
+    def request_frame(self, delay=0.0):
+        """Render after `delay` seconds instead of at the next refresh tick."""
+        if self.on_redraw is not None:
+            self.on_redraw(delay)
 
     def update_scroll_x_left(self):
         self.scroll_x = max(0, self.scroll_x - 20)
+        self.request_frame()
 
     def update_scroll_x_right(self):
-        max_scroll_x = self.update_max_scroll_x()
-        self.scroll_x = min(max_scroll_x, self.scroll_x + 20)
+        self.scroll_x = min(self.max_scroll_x, self.scroll_x + 20)
+        self.request_frame()
 
     def update_scroll_y_up(self):
         if len(self.data_lines) > self.max_lines:
             self.scroll_index = max(0, self.scroll_index - 1)
+        self.request_frame()
 
     def update_scroll_y_down(self):
         if len(self.data_lines) > self.max_lines:
             self.scroll_index = min(len(self.data_lines) - self.max_lines, self.scroll_index + 1)
+        self.request_frame()
+
+    def next_neighbor(self):
+        if len(self.neighbor_keys) > 1:
+            self.neighbor_index = (self.neighbor_index + 1) % len(self.neighbor_keys)
+            self.scroll_index = 0
+            self.scroll_x = 0
+            self.lldp_version = -1
+            self.request_frame()
+
+    def toggle_debug_page(self):
+        self.debug_page = not self.debug_page
+        self.scroll_index = 0
+        self.scroll_x = 0
+        self.lldp_version = -1
+        self.request_frame()
+
+    def build_debug_lines(self):
+        histograms, counters, threads = metrics.snapshot()
+        data_lines = [f"RSS: {metrics.rss_bytes() / 1048576:.1f} MB"]
+        for name, histogram in histograms:
+            data_lines.append(f"{name} p50/p95 ms: {histogram.quantile(0.5) * 1000:.1f}/{histogram.quantile(0.95) * 1000:.1f}")
+        for name, value in counters:
+            data_lines.append(f"{name}: {value}")
+        for name, alive in threads:
+            data_lines.append(f"{name}: {'up' if alive else 'down'}")
+        return data_lines
+
+    def build_linktest_lines(self):
+        test = self.db.hgetall('linktest')
+        if not test:
+            return []
+        if test.get('status') != 'done':
+            return [f"Link test: {test.get('status')} {test.get('error', test.get('peer', ''))}"]
+        data_lines = [
+            f"Negotiated/local: {test['negotiated']} {test['local_speed']}",
+            f"TCP up/down Mbit/s: {test['tcp_up_mbps']}/{test['tcp_down_mbps']}",
+            f"UDP Mbit/s, loss: {test['udp_mbps']}, {test['udp_loss_pct']}%",
+            f"RTT/jitter ms: {test['rtt_avg_ms']}/{test['jitter_ms']}, {test['loss_pct']}% lost",
+        ]
+        if test.get('duplex_mismatch') == '1':
+            data_lines.insert(0, "Link test: duplex mismatch")
+        return data_lines
+
+    def read_neighbor(self):
+        self.neighbor_keys = sorted(self.db.smembers('LLDP:neighbors'))
+        if not self.neighbor_keys:
+            self.neighbor_index = 0
+            return self.db.hgetall('LLDP')
+        self.neighbor_index = min(self.neighbor_index, len(self.neighbor_keys) - 1)
+        return self.db.hgetall(self.neighbor_keys[self.neighbor_index])
 
     def get_max_content_width(self, data_lines, font_path, font_size, serial_display_width):
-        font = ImageFont.truetype(font_path, font_size)
         max_width = 0
         for line in data_lines:
             try:
                 label, value = line.split(": ", 1)
             except ValueError:
                 value = line
-            width = font.getlength(value)
+            width = self.fonts.text_width(font_path, font_size, value)
             if width > max_width:
                 max_width = width
         return max_width
 
+    def set_plan(self, plan):
+        """Swap in a recompiled plan; the next frame rebuilds the lines with it."""
+        self.plan = plan
+        self.lldp_version = -1
+        self.request_frame()
+
     def update_max_scroll_x(self):
+        plan = self.plan
+        max_content_width = self.get_max_content_width(self.data_lines, plan.font_path, plan.font_size, plan.width)
+        self.max_scroll_x = max(0, int(max_content_width - plan.width + 10))
+        self.scroll_x = min(self.scroll_x, self.max_scroll_x)
+        return self.max_scroll_x
+
+    def build_data_lines(self, lldp):
+        data_lines = []
+        if len(self.neighbor_keys) > 1:
+            data_lines.append(f"Neighbor {self.neighbor_index + 1}/{len(self.neighbor_keys)}: {lldp.get('interface', '-')}")
+        if lldp.get('stale') == '1':
+            data_lines.append("Cached: waiting for LLDP")
+        data_lines.extend(self.build_linktest_lines())
+        for label, key in self.plan.fields:
+            data_lines.append(f"{label}: {lldp.get(key, '-')}")
+        return data_lines
+
+    def open_device(self):
+        c = self.context
+        if c.config['serial_display_type'] != 'lcd_st7735':
+            return None
+        from luma.core.interface.serial import spi
+        from luma.lcd.device import st7735
+        DISPLAY_WIDTH = c.config.get('serial_display_width', 128)
+        DISPLAY_HEIGHT = c.config.get('serial_display_height', 128)
+        DISPLAY_ROTATE = c.config.get('serial_display_rotate', 0)
+        DISPLAY_HORIZONTAL_OFFSET = c.config.get('serial_display_horizontal_offset', 1)
+        DISPLAY_VERTICAL_OFFSET = c.config.get('serial_display_vertical_offset', 2)
+        DISPLAY_BACKGROUND = str(c.config.get('serial_display_background', True))
+        serial = spi(device=0, port=0, bus_speed_hz=8000000, transfer_size=4096, gpio_DC=25, gpio_RST=27)
+        device = st7735(serial, width=DISPLAY_WIDTH, height=DISPLAY_HEIGHT,
+                        h_offset=DISPLAY_HORIZONTAL_OFFSET, v_offset=DISPLAY_VERTICAL_OFFSET,
+                        bgr=DISPLAY_BACKGROUND, persist=False, rotate=DISPLAY_ROTATE)
+        if c.config.get('serial_display_partial_update', True):
+            device = PartialUpdateDisplay(device)
+        self.device = device
+        return device
+
+    def splash(self, text="Waiting for link"):
+        if self.device is None and self.open_device() is None:
+            return
+        with canvas(self.device) as draw:
+            font = self.fonts.get_font(self.plan.font_path, self.plan.font_size)
+            draw.text((1, 0), "RPiNT", font=font, fill=self.plan.header_color)
+            draw.text((1, 25), text, font=font, fill=self.plan.label_color)
+
+    def sleep(self):
+        if self.device is not None and not self.asleep:
+            self.device.hide()
+            self.asleep = True
+
+    def wake(self):
+        if self.device is not None and self.asleep:
+            self.device.show()
+            self.asleep = False
+            self.lldp_version = -1
+
+    def scroll_target(self):
+        return self.scroll_x, self.scroll_index * self.layout.line_height * 2
+
+    def animate(self):
+        """Move the viewport towards the scroll target; True while still moving."""
+        target_x, target_y = self.scroll_target()
+        step = self.plan.scroll_step or max(abs(target_x - self.view_x), abs(target_y - self.view_y))
+        self.view_x += max(-step, min(step, target_x - self.view_x))
+        self.view_y += max(-step, min(step, target_y - self.view_y))
+        return (self.view_x, self.view_y) != (target_x, target_y)
+
+    def render_frame(self, device, x=0):
+        plan = self.plan
+        with metrics.stage('render'):
+            if self.debug_page:
+                self.data_lines = self.build_debug_lines()
+                self.update_max_scroll_x()
+            else:
+                lldp_version = (self.db.get('LLDP_version'), self.db.get('linktest_version'))
+                if lldp_version != self.lldp_version:
+                    self.lldp_version = lldp_version
+                    self.data_lines = self.build_data_lines(self.read_neighbor())
+                    self.update_max_scroll_x()
+            self.scroll_index = max(0, min(self.scroll_index, len(self.data_lines) - self.max_lines))
+            self.layout.mode = device.mode
+            self.layout.render(self.data_lines, plan, device.width)
+            moving = self.animate()
+            header = None
+            if plan.show_battery:
+                header = f"Battery {self.db.get('battery_power')}%"
+            image = self.layout.frame(device.size, self.view_x - x, self.view_y, self.max_lines, plan, header)
+        with metrics.stage('spi'):
+            device.display(image)
+        return moving
+
+    def start(self):
+        from utils.redis_utils import CachedRedis
         c = self.context
-        max_content_width = self.get_max_content_width(
-            self.data_lines, c.font_path, c.config['font_size'], c.config.get('serial_display_width', 128)
-        )
-        return max(0, int(max_content_width - c.config.get('serial_display_width', 128) + 10))
+        if self.device is None and self.open_device() is None:
+            return False
+        if c.config.get('redis_client_cache', True):
+            self.db = CachedRedis(c.redis_db)
+        else:
+            self.db = c.redis_db
+        self.cache_stats = isinstance(self.db, CachedRedis)
+        return True
 
-    def serial_displays(self):
+    def step(self):
         c = self.context
-        if c.config['serial_display_type'] == 'lcd_st7735':
-            DISPLAY_WIDTH = c.config.get('serial_display_width', 128)
-            DISPLAY_HEIGHT = c.config.get('serial_display_height', 128)
-            DISPLAY_ROTATE = c.config.get('serial_display_rotate', 0)
-            DISPLAY_HORIZONTAL_OFFSET = c.config.get('serial_display_horizontal_offset', 1)
-            DISPLAY_VERTICAL_OFFSET = c.config.get('serial_display_vertical_offset', 2)
-            DISPLAY_BACKGROUND = str(c.config.get('serial_display_background', True))
-            x = 0
-            serial = spi(device=0, port=0, bus_speed_hz=8000000, transfer_size=4096, gpio_DC=25, gpio_RST=27)
-            device = st7735(serial, width=DISPLAY_WIDTH, height=DISPLAY_HEIGHT,
-                            h_offset=DISPLAY_HORIZONTAL_OFFSET, v_offset=DISPLAY_VERTICAL_OFFSET,
-                            bgr=DISPLAY_BACKGROUND, persist=False, rotate=DISPLAY_ROTATE)
-            while not c.stop_event.is_set():
-                lldp = c.redis_db.hgetall('LLDP')
-                self.data_lines = []
-                if c.config.get("show_chassis_id", False): self.data_lines.append(f"Chassis ID: {lldp.get('chassis_id', '-')}")
-                if c.config.get("show_port_id", False): self.data_lines.append(f"Port ID: {lldp.get('port_id', '-')}")
-                if c.config.get("show_vlan_id", False): self.data_lines.append(f"VLAN ID: {lldp.get('vlan_id', '-')}")
-                if c.config.get("show_chassis_description", False): self.data_lines.append(f"Description: {lldp.get('chassis_description', '-')}")
-                if c.config.get("show_port_descr", False): self.data_lines.append(f"Port Description: {lldp.get('port_descr', '-')}")
-                if c.config.get("show_auto_neg_current", False): self.data_lines.append(f"Current Mode: {lldp.get('auto_neg_current', '-')}")
-                if c.config.get("show_auto_supported", False): self.data_lines.append(f"Auto Support: {lldp.get('auto_supported', '-')}")
-                if c.config.get("show_auto_enabled", False): self.data_lines.append(f"Auto Enable: {lldp.get('auto_enabled', '-')}")
-                if c.config.get("show_available_modes_str", False): self.data_lines.append(f"Available Modes: {lldp.get('available_modes_str', '-')}")
-                if c.config.get("show_power_supported", False): self.data_lines.append(f"Power Support: {lldp.get('power_supported', '-')}")
-                if c.config.get("show_power_enabled", False): self.data_lines.append(f"Power Enabled: {lldp.get('power_enabled', '-')}")
-                if c.config.get("show_device_type", False): self.data_lines.append(f"Device Type: {lldp.get('lldp_med_device_type', '-')}")
-                if c.config.get("show_management_ip", False): self.data_lines.append(f"Management IP: {lldp.get('management_ip', '-')}")
-                visible_lines = self.data_lines[self.scroll_index:self.scroll_index + self.max_lines]
-                with canvas(device) as draw:
-                    font = ImageFont.truetype(c.font_path, c.config['font_size'])
-                    y_offset = 25
-                    line_spacing = c.config['font_size'] + 1
-                    if c.config.get('use_ups_hat', False):
-                        battery_power = c.redis_db.get('battery_power')
-                        draw.text((x+1, 0), f"Battery {battery_power}%", font=font, fill="yellow")
-                    for i, line in enumerate(visible_lines, start=0):
-                        try:
-                            label, value = line.split(": ")
-                        except ValueError:
-                            label, value = line, ""
-                        x_position = x+1 - self.scroll_x
-                        y_position = y_offset + (line_spacing * 2 * i)
-                        draw.text((x_position, y_position), label, font=font, fill="lime")
-                        draw.text((x_position, y_position + line_spacing), f"{value}", font=font, fill="cyan")
-                sleep(1 / c.config['serial_display_refresh_rate'])
+        device = self.device
+        if self.render_frame(device):
+            # one animation step per refresh period, even while a power profile slows the display task
+            self.request_frame(self.plan.refresh_period)
+        if isinstance(device, PartialUpdateDisplay) and device.bytes_per_second != self.bytes_per_second:
+            self.bytes_per_second = device.bytes_per_second
+            c.redis_db.set('display_bytes_per_second', self.bytes_per_second)
+        if self.cache_stats and monotonic() >= self.stats_due:
+            self.stats_due = monotonic() + 5
+            c.redis_db.hset('display_cache', mapping={'hits': self.db.hits, 'misses': self.db.misses})
+
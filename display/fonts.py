@@ -0,0 +1,29 @@
+from collections import OrderedDict
+from PIL import ImageFont
+
+class FontManager:
+    """Loads each (path, size) font once and memoizes text widths (LRU)."""
+    def __init__(self, max_widths=512):
+        self.max_widths = max_widths
+        self.fonts = {}
+        self.widths = OrderedDict()
+
+    def get_font(self, font_path, font_size):
+        key = (font_path, font_size)
+        font = self.fonts.get(key)
+        if font is None:
+            font = ImageFont.truetype(font_path, font_size)
+            self.fonts[key] = font
+        return font
+
+    def text_width(self, font_path, font_size, text):
+        key = (font_path, font_size, text)
+        width = self.widths.get(key)
+        if width is not None:
+            self.widths.move_to_end(key)
+            return width
+        width = self.get_font(font_path, font_size).getlength(text)
+        self.widths[key] = width
+        if len(self.widths) > self.max_widths:
+            self.widths.popitem(last=False)
+        return width
@@ -0,0 +1,77 @@
+from time import monotonic
+from PIL import ImageChops
+
+class PartialUpdateDisplay:
+    """Wraps a luma st7735 device and only sends what changed on screen.
+
+    It is installed as the device's luma framebuffer, so redraw() yields
+    the changed row bands of each rotated frame and the device itself
+    adds h_offset/v_offset and writes them through the ST7735 address
+    window (CASET/RASET/RAMWR), as it would a full frame.
+    """
+    def __init__(self, device, band_height=8):
+        self.device = device
+        self.native = hasattr(device, 'framebuffer')
+        if self.native:
+            device.framebuffer = self
+        self.band_height = band_height
+        self.last_frame = None
+        self.bytes_sent = 0
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.bytes_per_second = 0
+        self._window_start = monotonic()
+        self._window_bytes = 0
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def display(self, image):
+        if not self.native:
+            for _ in self.redraw(self.device.preprocess(image)):
+                pass
+        self.device.display(image)
+        self.update_rate()
+
+    def redraw(self, image):
+        """luma framebuffer interface: yields (part, window) for every changed band of a rotated frame."""
+        if self.last_frame is None or self.last_frame.size != image.size:
+            windows = [(0, 0, image.width, image.height)]
+        else:
+            windows = self.changed_windows(ImageChops.difference(self.last_frame, image))
+        self.last_frame = image.copy()
+        if not windows:
+            self.frames_skipped += 1
+            return
+        self.frames_sent += 1
+        for window in windows:
+            part = image.crop(window)
+            sent = part.width * part.height * len(part.getbands())
+            self.bytes_sent += sent
+            self._window_bytes += sent
+            yield part, window
+
+    def changed_windows(self, diff):
+        if diff.getbbox() is None:
+            return []
+        windows = []
+        for top in range(0, diff.height, self.band_height):
+            bottom = min(top + self.band_height, diff.height)
+            bbox = diff.crop((0, top, diff.width, bottom)).getbbox()
+            if bbox is None:
+                continue
+            left, right = bbox[0], bbox[2]
+            if windows and windows[-1][3] == top:
+                prev_left, prev_top, prev_right, _ = windows[-1]
+                windows[-1] = (min(prev_left, left), prev_top, max(prev_right, right), bottom)
+            else:
+                windows.append((left, top, right, bottom))
+        return windows
+
+    def update_rate(self):
+        now = monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= 1:
+            self.bytes_per_second = round(self._window_bytes / elapsed)
+            self._window_start = now
+            self._window_bytes = 0
@@ -0,0 +1,60 @@
+from PIL import Image, ImageDraw
+
+class VirtualCanvas:
+    """The whole label/value text layout, rendered once off screen.
+
+    render() redraws the layout only when the lines or the plan change;
+    frame() then crops the viewport at a pixel offset and pastes it under
+    the header, so scrolling never touches the glyph rasterizer.
+    """
+    def __init__(self, fonts, mode='RGB', header_height=25):
+        self.fonts = fonts
+        self.mode = mode
+        self.header_height = header_height
+        self.image = None
+        self.key = None
+        self.line_height = 0
+        self._header = (None, None)
+
+    def render(self, data_lines, plan, width):
+        key = (tuple(data_lines), plan, width)
+        if key == self.key:
+            return False
+        font_path, font_size = plan.font_path, plan.font_size
+        font = self.fonts.get_font(font_path, font_size)
+        self.line_height = plan.line_height
+        pairs = []
+        for line in data_lines:
+            try:
+                label, value = line.split(": ", 1)
+            except ValueError:
+                label, value = line, ""
+            pairs.append((label, value))
+        text_width = max((self.fonts.text_width(font_path, font_size, text) for pair in pairs for text in pair),
+                         default=0)
+        self.image = Image.new(self.mode, (max(width, int(text_width) + 2), max(1, self.line_height * 2 * len(pairs))))
+        draw = ImageDraw.Draw(self.image)
+        for i, (label, value) in enumerate(pairs):
+            y = self.line_height * 2 * i
+            draw.text((1, y), label, font=font, fill=plan.label_color)
+            draw.text((1, y + self.line_height), value, font=font, fill=plan.value_color)
+        self.key = key
+        return True
+
+    def header(self, size, text, plan):
+        if self._header[0] != (size, text, plan):
+            image = Image.new(self.mode, (size[0], self.header_height))
+            if text:
+                font = self.fonts.get_font(plan.font_path, plan.font_size)
+                ImageDraw.Draw(image).text((1, 0), text, font=font, fill=plan.header_color)
+            self._header = ((size, text, plan), image)
+        return self._header[1]
+
+    def frame(self, size, x, y, rows, plan, header_text=None):
+        width, height = size
+        image = Image.new(self.mode, size)
+        image.paste(self.header(size, header_text, plan), (0, 0))
+        bottom = min(self.header_height + rows * self.line_height * 2, height)
+        view = self.image.crop((x, y, x + width, y + bottom - self.header_height))
+        image.paste(view, (0, self.header_height))
+        return image
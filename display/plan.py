@@ -0,0 +1,51 @@
+from collections import namedtuple
+
+# (rpint.toml flag, label, LLDP field), in display order
+FIELDS = (
+    ('show_chassis_id', 'Chassis ID', 'chassis_id'),
+    ('show_port_id', 'Port ID', 'port_id'),
+    ('show_vlan_id', 'VLAN ID', 'vlan_id'),
+    ('show_chassis_description', 'Description', 'chassis_description'),
+    ('show_port_descr', 'Port Description', 'port_descr'),
+    ('show_auto_neg_current', 'Current Mode', 'auto_neg_current'),
+    ('show_auto_supported', 'Auto Support', 'auto_supported'),
+    ('show_auto_enabled', 'Auto Enable', 'auto_enabled'),
+    ('show_available_modes_str', 'Available Modes', 'available_modes_str'),
+    ('show_power_supported', 'Power Support', 'power_supported'),
+    ('show_power_enabled', 'Power Enabled', 'power_enabled'),
+    ('show_device_type', 'Device Type', 'lldp_med_device_type'),
+    ('show_management_ip', 'Management IP', 'management_ip'),
+)
+
+DisplayPlan = namedtuple('DisplayPlan', [
+    'fields', 'font_path', 'font_size', 'line_height', 'label_color', 'value_color', 'header_color',
+    'show_battery', 'refresh_period', 'scroll_step', 'width', 'height',
+])
+
+def compile_plan(config, font_path):
+    """Everything the render loop needs from rpint.toml, resolved once.
+
+    `display_fields`, a list of LLDP field names, overrides the show_*
+    flags and sets the order of the lines.
+    """
+    names = config.get('display_fields')
+    if names is None:
+        fields = tuple((label, key) for flag, label, key in FIELDS if config.get(flag, False))
+    else:
+        labels = {key: label for _, label, key in FIELDS}
+        fields = tuple((labels[name], name) for name in names if name in labels)
+    font_size = config.get('font_size', 15)
+    return DisplayPlan(
+        fields=fields,
+        font_path=font_path,
+        font_size=font_size,
+        line_height=font_size + 1,
+        label_color=config.get('serial_display_label_color', 'lime'),
+        value_color=config.get('serial_display_value_color', 'cyan'),
+        header_color=config.get('serial_display_header_color', 'yellow'),
+        show_battery=bool(config.get('use_ups_hat', False)),
+        refresh_period=1 / config.get('serial_display_refresh_rate', 5),
+        scroll_step=config.get('serial_display_scroll_step', 0),
+        width=config.get('serial_display_width', 128),
+        height=config.get('serial_display_height', 128),
+    )
@@ -0,0 +1,178 @@
+"""Link test reflector: python3 -m linktest.reflector [--host 0.0.0.0] [--port 5201]"""
+import argparse
+import fcntl
+import os
+import socket
+import struct
+import threading
+from collections import OrderedDict
+from time import monotonic, monotonic_ns
+from systemd import journal
+
+PORT = 5201
+CHUNK = 256 * 1024
+
+# TCP request: mode (b'U' client sends, b'D' client receives) and duration in ms
+REQUEST = struct.Struct('!cI')
+# TCP upload result: bytes received, seconds from first byte to EOF
+RESULT = struct.Struct('!Qd')
+# UDP packet: kind, session, sequence number, sender's monotonic_ns
+PACKET = struct.Struct('!cIIQ')
+# UDP reply to b'R': kind, session, packets, bytes, seconds from first to last packet
+REPORT = struct.Struct('!cIQQd')
+
+def payload_file(size=CHUNK):
+    """A file of zeros in RAM to sendfile() from, so sent data never passes through Python."""
+    fd = os.memfd_create('linktest', os.MFD_CLOEXEC)
+    os.ftruncate(fd, size)
+    return fd
+
+def send_for(sock, fd, seconds, size=CHUNK):
+    """sendfile() the payload over and over for `seconds`; returns bytes sent."""
+    out = sock.fileno()
+    deadline = monotonic() + seconds
+    total = offset = 0
+    while monotonic() < deadline:
+        try:
+            sent = os.sendfile(out, fd, offset, size - offset)
+        except BlockingIOError:
+            raise TimeoutError('send timed out') from None
+        total += sent
+        offset = (offset + sent) % size
+    return total
+
+def sink(sock, size=CHUNK):
+    """Discard everything until EOF; returns (bytes, seconds from first byte to EOF).
+
+    The data is splice()d from the socket through a pipe into /dev/null
+    and is never copied into user space.
+    """
+    r, w = os.pipe()
+    null = os.open(os.devnull, os.O_WRONLY)
+    total = 0
+    first = None
+    try:
+        try:
+            fcntl.fcntl(w, fcntl.F_SETPIPE_SZ, size)
+        except OSError:
+            pass
+        while True:
+            try:
+                moved = os.splice(sock.fileno(), w, size)
+            except BlockingIOError:
+                raise TimeoutError('receive timed out') from None
+            if not moved:
+                break
+            if first is None:
+                first = monotonic()
+            total += moved
+            while moved:
+                moved -= os.splice(r, null, moved)
+    finally:
+        for fd in (r, w, null):
+            os.close(fd)
+    return total, 0.0 if first is None else monotonic() - first
+
+def set_timeout(sock, seconds):
+    """Kernel-side send/receive timeouts; a socket timeout would make sendfile/splice non-blocking."""
+    timeval = struct.pack('@ll', int(seconds), int(seconds % 1 * 1e6))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, timeval)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, timeval)
+
+class Reflector:
+    """Peer for linktest.tester: TCP sink and source, UDP echo and counter.
+
+    A TCP client sends a REQUEST. For b'U' the reflector discards the data
+    until EOF and answers with a RESULT; for b'D' it sends data for the
+    requested time and closes. UDP packets of kind b'E' are echoed back
+    unchanged, b'S' packets are only counted per session, and a b'R'
+    packet is answered with a REPORT of that session's count.
+    """
+    def __init__(self, host='0.0.0.0', port=PORT, sessions=64):
+        self.host = host
+        self.port = port
+        self.sessions = OrderedDict()
+        self.max_sessions = sessions
+        self.tcp = socket.create_server((host, port))
+        self.port = self.tcp.getsockname()[1]
+        self.udp = socket.socket(self.tcp.family, socket.SOCK_DGRAM)
+        self.udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.udp.bind((host, self.port))
+        self.payload = payload_file()
+
+    def serve(self, stop_event):
+        self.tcp.settimeout(0.5)
+        self.udp.settimeout(0.5)
+        udp = threading.Thread(target=self.serve_udp, args=(stop_event,), name='Thread-linktest-udp', daemon=True)
+        udp.start()
+        journal.send(f"Link test reflector listening on {self.host}:{self.port}")
+        while not stop_event.is_set():
+            try:
+                conn, peer = self.tcp.accept()
+            except TimeoutError:
+                continue
+            threading.Thread(target=self.handle_tcp, args=(conn, peer), daemon=True).start()
+        udp.join()
+        self.tcp.close()
+        self.udp.close()
+        os.close(self.payload)
+
+    def handle_tcp(self, conn, peer):
+        with conn:
+            conn.settimeout(None)
+            set_timeout(conn, 5)
+            try:
+                header = conn.recv(REQUEST.size, socket.MSG_WAITALL)
+                if len(header) != REQUEST.size:
+                    return
+                mode, milliseconds = REQUEST.unpack(header)
+                if mode == b'U':
+                    conn.sendall(RESULT.pack(*sink(conn)))
+                elif mode == b'D':
+                    send_for(conn, self.payload, min(milliseconds, 60000) / 1000)
+                    conn.shutdown(socket.SHUT_WR)
+            except OSError as e:
+                journal.send(f"Link test from {peer[0]} failed: {e}")
+
+    def serve_udp(self, stop_event):
+        buffer = bytearray(65536)
+        view = memoryview(buffer)
+        udp = self.udp
+        sessions = self.sessions
+        while not stop_event.is_set():
+            try:
+                size, address = udp.recvfrom_into(buffer)
+            except TimeoutError:
+                continue
+            if size < PACKET.size:
+                continue
+            kind, session, _, _ = PACKET.unpack_from(buffer)
+            if kind == b'E':
+                udp.sendto(view[:size], address)
+            elif kind == b'S':
+                now = monotonic_ns()
+                counts = sessions.get(session)
+                if counts is None:
+                    counts = sessions[session] = [0, 0, now, now]
+                    if len(sessions) > self.max_sessions:
+                        sessions.popitem(last=False)
+                counts[0] += 1
+                counts[1] += size
+                counts[3] = now
+            elif kind == b'R':
+                packets, total, first, last = sessions.get(session, (0, 0, 0, 0))
+                udp.sendto(REPORT.pack(b'R', session, packets, total, (last - first) / 1e9), address)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args()
+    stop_event = threading.Event()
+    try:
+        Reflector(args.host, args.port).serve(stop_event)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+if __name__ == '__main__':
+    main()
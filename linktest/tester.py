@@ -0,0 +1,268 @@
+"""Link test: python3 -m linktest.tester --peer HOST | --local [--seconds 5] [--udp-rate 95]"""
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import threading
+from time import monotonic, monotonic_ns, sleep, strftime
+from systemd import journal
+
+from .reflector import (PORT, REQUEST, RESULT, PACKET, REPORT, Reflector, payload_file, send_for, sink,
+                        set_timeout)
+
+class LinkTestError(Exception):
+    pass
+
+def tcp_upload(host, port, seconds):
+    """Bits per second the reflector received from us over TCP."""
+    fd = payload_file()
+    try:
+        with socket.create_connection((host, port), timeout=5) as sock:
+            sock.settimeout(None)
+            set_timeout(sock, 5)
+            sock.sendall(REQUEST.pack(b'U', int(seconds * 1000)))
+            send_for(sock, fd, seconds)
+            sock.shutdown(socket.SHUT_WR)
+            reply = sock.recv(RESULT.size, socket.MSG_WAITALL)
+    finally:
+        os.close(fd)
+    if len(reply) != RESULT.size:
+        raise LinkTestError('no result from reflector')
+    received, elapsed = RESULT.unpack(reply)
+    return received * 8 / elapsed if elapsed else 0.0
+
+def tcp_download(host, port, seconds):
+    """Bits per second we received from the reflector over TCP."""
+    with socket.create_connection((host, port), timeout=5) as sock:
+        sock.settimeout(None)
+        set_timeout(sock, 5)
+        sock.sendall(REQUEST.pack(b'D', int(seconds * 1000)))
+        received, elapsed = sink(sock)
+    return received * 8 / elapsed if elapsed else 0.0
+
+def udp_socket(host, port):
+    sock = socket.socket(socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0][0], socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+    sock.connect((host, port))
+    return sock
+
+def udp_latency(host, port, count=100, interval=0.01, size=64, timeout=1.0):
+    """Round trips of `count` echoed packets: (rtts in ms by sequence number, packets sent)."""
+    session = random.getrandbits(32)
+    out = bytearray(max(size, PACKET.size))
+    buffer = bytearray(2048)
+    rtts = {}
+    with udp_socket(host, port) as sock:
+        sent = 0
+        next_send = monotonic()
+        deadline = None
+        while len(rtts) < count:
+            now = monotonic()
+            if sent < count and now >= next_send:
+                PACKET.pack_into(out, 0, b'E', session, sent, monotonic_ns())
+                sock.send(out)
+                sent += 1
+                next_send += interval
+                if sent == count:
+                    deadline = now + timeout
+            wait = (next_send if sent < count else deadline) - monotonic()
+            if sent == count and wait <= 0:
+                break
+            sock.settimeout(max(wait, 0.0005))
+            try:
+                received = sock.recv_into(buffer)
+            except TimeoutError:
+                continue
+            except ConnectionRefusedError:
+                raise LinkTestError('no reflector on UDP port') from None
+            arrived = monotonic_ns()
+            if received < PACKET.size:
+                continue
+            kind, reply_session, seq, sent_ns = PACKET.unpack_from(buffer)
+            if kind == b'E' and reply_session == session and seq not in rtts:
+                rtts[seq] = (arrived - sent_ns) / 1e6
+    return [rtts[seq] for seq in sorted(rtts)], count
+
+def udp_throughput(host, port, seconds, rate, size=1472):
+    """Send at `rate` bits per second: (bits per second received, loss fraction)."""
+    session = random.getrandbits(32)
+    out = bytearray(size)
+    packet_bits = size * 8
+    with udp_socket(host, port) as sock:
+        sent = 0
+        start = monotonic()
+        while True:
+            elapsed = monotonic() - start
+            if elapsed >= seconds:
+                break
+            due = min(int(elapsed * rate / packet_bits) + 1, int(seconds * rate / packet_bits))
+            while sent < due:
+                PACKET.pack_into(out, 0, b'S', session, sent, 0)
+                try:
+                    sock.send(out)
+                except OSError:
+                    pass
+                sent += 1
+            sleep(0.001)
+        sleep(0.2)
+        request = PACKET.pack(b'R', session, 0, 0)
+        sock.settimeout(0.5)
+        for _ in range(5):
+            sock.send(request)
+            try:
+                reply = sock.recv(REPORT.size)
+            except TimeoutError:
+                continue
+            except ConnectionRefusedError:
+                raise LinkTestError('no reflector on UDP port') from None
+            kind, reply_session, packets, received, elapsed = REPORT.unpack(reply)
+            if kind == b'R' and reply_session == session:
+                break
+        else:
+            raise LinkTestError('no UDP report from reflector')
+    loss = max(0.0, 1 - packets / sent) if sent else 0.0
+    return (received * 8 / elapsed if elapsed else 0.0), loss
+
+def jitter(rtts):
+    """Mean difference between consecutive round trips, as in RFC 3550."""
+    if len(rtts) < 2:
+        return 0.0
+    return sum(abs(b - a) for a, b in zip(rtts, rtts[1:])) / (len(rtts) - 1)
+
+def link_speed(interface):
+    """Local negotiated speed in Mbit/s and duplex from sysfs, or (None, None)."""
+    try:
+        with open(f'/sys/class/net/{interface}/speed') as file:
+            speed = int(file.read())
+        with open(f'/sys/class/net/{interface}/duplex') as file:
+            duplex = file.read().strip()
+    except (OSError, ValueError):
+        return None, None
+    if speed <= 0 or duplex not in ('full', 'half'):
+        return None, None
+    return speed, duplex
+
+def advertised_speed(mode):
+    """Speed in Mbit/s and duplex from an LLDP MAU type such as '100BaseTXFD'.
+
+    lldpcli appends a description ('1000BaseTFD - Four-pair Category 5
+    UTP, full duplex mode'), so only the first token is looked at.
+    """
+    match = re.match(r'(\d+)Base(\S*)', mode or '')
+    if not match:
+        return None, None
+    suffix = match.group(2)
+    return int(match.group(1)), 'full' if suffix.endswith('FD') else 'half' if suffix.endswith('HD') else None
+
+def run_test(host, port=PORT, seconds=5, udp_rate=None, interface='eth0', negotiated=None):
+    """Run every measurement against a reflector and return the results as strings for Redis."""
+    speed, duplex = link_speed(interface)
+    switch_speed, switch_duplex = advertised_speed(negotiated)
+    if udp_rate is None:
+        udp_rate = (speed or switch_speed or 100) * 0.95e6
+    rtts, sent = udp_latency(host, port)
+    if not rtts:
+        raise LinkTestError(f'no UDP echo from {host}:{port}')
+    up = tcp_upload(host, port, seconds)
+    down = tcp_download(host, port, seconds)
+    udp, udp_loss = udp_throughput(host, port, seconds, udp_rate)
+    result = {
+        'status': 'done',
+        'time': strftime('%Y-%m-%d %H:%M:%S'),
+        'peer': f'{host}:{port}',
+        'negotiated': negotiated or '--',
+        'local_speed': f'{speed}/{duplex}' if speed else '--',
+        'tcp_up_mbps': round(up / 1e6, 1),
+        'tcp_down_mbps': round(down / 1e6, 1),
+        'udp_rate_mbps': round(udp_rate / 1e6, 1),
+        'udp_mbps': round(udp / 1e6, 1),
+        'udp_loss_pct': round(udp_loss * 100, 2),
+        'rtt_min_ms': round(min(rtts), 3),
+        'rtt_avg_ms': round(sum(rtts) / len(rtts), 3),
+        'rtt_max_ms': round(max(rtts), 3),
+        'jitter_ms': round(jitter(rtts), 3),
+        'loss_pct': round((1 - len(rtts) / sent) * 100, 2),
+        'duplex_mismatch': int(bool(duplex and switch_duplex and duplex != switch_duplex)),
+    }
+    return {k: str(v) for k, v in result.items()}
+
+def record(redis_db, result):
+    pipe = redis_db.pipeline()
+    pipe.delete('linktest')
+    pipe.hset('linktest', mapping=result)
+    pipe.incr('linktest_version')
+    pipe.execute()
+
+class LinkTester:
+    """Runs one link test at a time from rpint and keeps its result in the 'linktest' hash."""
+    def __init__(self, context):
+        self.context = context
+        self.lock = threading.Lock()
+
+    def run(self):
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            c = self.context
+            peer = c.config.get('linktest_peer')
+            if not peer:
+                return False
+            record(c.redis_db, {'status': 'running', 'peer': peer})
+            result = {'status': 'failed', 'peer': peer, 'error': 'aborted'}
+            try:
+                negotiated = c.redis_db.hget('LLDP', 'auto_neg_current')
+                result = run_test(peer, c.config.get('linktest_port', PORT), c.config.get('linktest_seconds', 5),
+                                  c.config.get('linktest_udp_rate') or None, c.config.get('lldp_interface', 'eth0'),
+                                  negotiated)
+            except Exception as e:
+                journal.send(f"Link test to {peer} failed: {e}")
+                result['error'] = str(e)
+            finally:
+                # never leave the hash at 'running', whatever went wrong
+                record(c.redis_db, result)
+            journal.send(f"Link test: {result}")
+            return True
+        finally:
+            self.lock.release()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--peer', help='host running linktest.reflector')
+    parser.add_argument('--local', action='store_true', help='start a reflector on 127.0.0.1 and test against it')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--udp-rate', type=float, help='UDP send rate in Mbit/s (default 95%% of the link speed)')
+    parser.add_argument('--interface', default='eth0')
+    parser.add_argument('--negotiated', help='mode advertised by the switch (default: read from Redis)')
+    parser.add_argument('--redis', action='store_true', help="store the result in RPiNT's Redis")
+    args = parser.parse_args()
+    if not args.peer and not args.local:
+        parser.error('--peer or --local is required')
+    stop_event = threading.Event()
+    host, port = args.peer, args.port
+    if args.local:
+        reflector = Reflector('127.0.0.1', 0)
+        threading.Thread(target=reflector.serve, args=(stop_event,), daemon=True).start()
+        host, port = '127.0.0.1', reflector.port
+    redis_db = None
+    if args.redis:
+        from utils.config import config_load
+        from utils.redis_utils import db_connect
+        config = config_load(os.getenv('RPINT_CONFIG_PATH', '/home/pi/scripts/RPiNT/rpint.toml'))['setup']
+        redis_db = db_connect(config.get('redis_host', 'localhost'), 0, config.get('redis_unix_socket'))
+    negotiated = args.negotiated
+    if negotiated is None and redis_db is not None:
+        negotiated = redis_db.hget('LLDP', 'auto_neg_current')
+    udp_rate = args.udp_rate * 1e6 if args.udp_rate else None
+    try:
+        result = run_test(host, port, args.seconds, udp_rate, args.interface, negotiated)
+    finally:
+        stop_event.set()
+    if redis_db is not None:
+        record(redis_db, result)
+    print(json.dumps(result, indent=2))
+
+if __name__ == '__main__':
+    main()
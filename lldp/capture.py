@@ -0,0 +1,234 @@
+import ctypes
+import socket
+import struct
+import sys
+import json
+from time import monotonic
+from systemd import journal
+
+from .lldp import parse_interface, neighbor_key
+
+ETH_P_LLDP = 0x88CC
+LLDP_MULTICAST = bytes.fromhex('0180c200000e')
+SOL_PACKET = 263
+PACKET_ADD_MEMBERSHIP = 1
+PACKET_MR_MULTICAST = 0
+SO_ATTACH_FILTER = 26
+
+# ldh [12]; jeq #0x88cc, L1, L2; L1: ret #0xffff; L2: ret #0
+LLDP_BPF = [
+    (0x28, 0, 0, 12),
+    (0x15, 0, 1, ETH_P_LLDP),
+    (0x06, 0, 0, 0xFFFF),
+    (0x06, 0, 0, 0),
+]
+
+DOT1_OUI = b'\x00\x80\xc2'
+DOT3_OUI = b'\x00\x12\x0f'
+MED_OUI = b'\x00\x12\xbb'
+
+AUTONEG_MODES = [
+    ('10Base-T', 0x4000, 0x2000),
+    ('100Base-T4', 0x1000, 0x1000),
+    ('100Base-TX', 0x0800, 0x0400),
+    ('100Base-T2', 0x0200, 0x0100),
+    ('1000Base-X', 0x0008, 0x0004),
+    ('1000Base-T', 0x0002, 0x0001),
+]
+
+MAU_TYPES = {
+    10: '10BaseTHD', 11: '10BaseTFD', 14: '100BaseT4', 15: '100BaseTXHD', 16: '100BaseTXFD',
+    17: '100BaseFXHD', 18: '100BaseFXFD', 19: '100BaseT2HD', 20: '100BaseT2FD',
+    21: '1000BaseXHD', 22: '1000BaseXFD', 23: '1000BaseLXHD', 24: '1000BaseLXFD',
+    25: '1000BaseSXHD', 26: '1000BaseSXFD', 27: '1000BaseCXHD', 28: '1000BaseCXFD',
+    29: '1000BaseTHD', 30: '1000BaseTFD',
+}
+
+MED_DEVICE_TYPES = {
+    1: 'Generic Endpoint (Class I)',
+    2: 'Media Endpoint (Class II)',
+    3: 'Communication Device Endpoint (Class III)',
+    4: 'Network Connectivity Device',
+}
+
+def decode_frame(frame, interface):
+    """Decode one Ethernet frame into (neighbor, ttl), or (None, 0)."""
+    if len(frame) < 14 or struct.unpack_from('!H', frame, 12)[0] != ETH_P_LLDP:
+        return None, 0
+    return decode_lldpdu(frame[14:], interface)
+
+def decode_lldpdu(payload, interface):
+    """Decode LLDP TLVs into the same record parse_interface() builds from lldpcli."""
+    chassis_id = port_id = None
+    ttl = 0
+    sysname = None
+    chassis = {}
+    port = {}
+    mgmt_ip = []
+    vlan_id = None
+    med_type = None
+    offset = 0
+    while offset + 2 <= len(payload):
+        header, = struct.unpack_from('!H', payload, offset)
+        tlv_type, length = header >> 9, header & 0x1FF
+        value = payload[offset + 2:offset + 2 + length]
+        offset += 2 + length
+        if tlv_type == 0:
+            break
+        elif tlv_type == 1 and value:
+            chassis_id = _format_id(value[0], value[1:], mac_subtype=4, addr_subtype=5)
+        elif tlv_type == 2 and value:
+            port_id = _format_id(value[0], value[1:], mac_subtype=3, addr_subtype=4)
+        elif tlv_type == 3 and len(value) >= 2:
+            ttl, = struct.unpack_from('!H', value)
+        elif tlv_type == 4:
+            port['descr'] = _text(value)
+        elif tlv_type == 5:
+            sysname = _text(value)
+        elif tlv_type == 6:
+            chassis['descr'] = _text(value)
+        elif tlv_type == 8 and len(value) >= 2:
+            address = _format_address(value[1], value[2:1 + value[0]])
+            if address:
+                mgmt_ip.append(address)
+        elif tlv_type == 127 and len(value) >= 4:
+            oui, subtype, data = value[:3], value[3], value[4:]
+            if oui == DOT1_OUI and subtype == 1 and len(data) >= 2:
+                vlan_id = str(struct.unpack_from('!H', data)[0])
+            elif oui == DOT1_OUI and subtype == 3 and len(data) >= 2 and vlan_id is None:
+                vlan_id = str(struct.unpack_from('!H', data)[0])
+            elif oui == DOT3_OUI and subtype == 1 and len(data) >= 5:
+                status, advertised, mau = struct.unpack_from('!BHH', data)
+                port['auto-negotiation'] = {
+                    'supported': bool(status & 0x01),
+                    'enabled': bool(status & 0x02),
+                    'advertised': _advertised_modes(advertised),
+                    'current': MAU_TYPES.get(mau, str(mau)),
+                }
+            elif oui == DOT3_OUI and subtype == 2 and len(data) >= 1:
+                port['power'] = {'supported': bool(data[0] & 0x02), 'enabled': bool(data[0] & 0x04)}
+            elif oui == MED_OUI and subtype == 1 and len(data) >= 3:
+                med_type = MED_DEVICE_TYPES.get(data[2], str(data[2]))
+    if chassis_id is None or port_id is None:
+        return None, 0
+    chassis = {'id': {'value': chassis_id}, **chassis}
+    if mgmt_ip:
+        chassis['mgmt-ip'] = mgmt_ip
+    data = {
+        'chassis': {sysname: chassis} if sysname else chassis,
+        'port': {'id': {'value': port_id}, **port},
+    }
+    if vlan_id is not None:
+        data['vlan'] = {'vlan-id': vlan_id}
+    if med_type is not None:
+        data['lldp-med'] = {'device-type': med_type}
+    return parse_interface(interface, data), ttl
+
+def _text(value):
+    return value.decode('utf-8', errors='replace').rstrip('\x00')
+
+def _format_id(subtype, value, mac_subtype, addr_subtype):
+    if subtype == mac_subtype and len(value) == 6:
+        return ':'.join(f'{b:02x}' for b in value)
+    if subtype == addr_subtype and value:
+        return _format_address(value[0], value[1:]) or value.hex()
+    return _text(value)
+
+def _format_address(family, address):
+    if family == 1 and len(address) == 4:
+        return socket.inet_ntop(socket.AF_INET, address)
+    if family == 2 and len(address) == 16:
+        return socket.inet_ntop(socket.AF_INET6, address)
+    return None
+
+def _advertised_modes(advertised):
+    return [{'type': name, 'hd': bool(advertised & hd), 'fd': bool(advertised & fd)}
+            for name, hd, fd in AUTONEG_MODES if advertised & (hd | fd)]
+
+def open_lldp_socket(interfaces):
+    """Raw AF_PACKET socket that only receives LLDP frames (needs CAP_NET_RAW)."""
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_LLDP))
+    bpf = ctypes.create_string_buffer(b''.join(struct.pack('HBBI', *insn) for insn in LLDP_BPF))
+    program = struct.pack('HP', len(LLDP_BPF), ctypes.addressof(bpf))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, program)
+    for interface in interfaces:
+        mreq = struct.pack('iHH8s', socket.if_nametoindex(interface), PACKET_MR_MULTICAST,
+                           len(LLDP_MULTICAST), LLDP_MULTICAST)
+        sock.setsockopt(SOL_PACKET, PACKET_ADD_MEMBERSHIP, mreq)
+    return sock
+
+def lldp_capture(on_update, stop_event, interfaces=('eth0',), sock=None, clock=monotonic, resets=None):
+    """Decode LLDPDUs straight off the wire and report the live neighbor list.
+
+    Neighbors are dropped when their TTL runs out or a TTL 0 (shutdown)
+    LLDPDU arrives. Interface names put on the `resets` queue (on a
+    carrier change) forget that interface's neighbors, so the next LLDPDU
+    is reported even if it is the same as before. Returns False if the raw
+    socket can't be opened, so the caller can fall back to lldpcli.
+    """
+    if sock is None:
+        try:
+            sock = open_lldp_socket(interfaces)
+        except OSError as e:
+            journal.send(f"LLDP capture socket failed: {e}")
+            return False
+    sock.settimeout(1)
+    neighbors = {}
+    expires = {}
+    on_update([])
+    try:
+        while not stop_event.is_set():
+            changed = False
+            try:
+                frame, address = sock.recvfrom(2048)
+            except socket.timeout:
+                frame, address = None, None
+            while resets is not None and not resets.empty():
+                interface = resets.get()
+                for key in [k for k, n in neighbors.items() if n['interface'] == interface]:
+                    del neighbors[key], expires[key]
+                    changed = True
+            if frame is not None and address[0] in interfaces:
+                neighbor, ttl = decode_frame(frame, address[0])
+                if neighbor is not None:
+                    key = neighbor_key(neighbor)
+                    if ttl == 0:
+                        changed = neighbors.pop(key, None) is not None
+                        expires.pop(key, None)
+                    else:
+                        changed = neighbors.get(key) != neighbor
+                        neighbors[key] = neighbor
+                        expires[key] = clock() + ttl
+            now = clock()
+            for key in [k for k, t in expires.items() if t <= now]:
+                del neighbors[key], expires[key]
+                changed = True
+            if changed:
+                on_update(list(neighbors.values()))
+    finally:
+        sock.close()
+    return True
+
+def read_pcap(path):
+    """Yield raw frames from a classic libpcap file (for offline decoding)."""
+    with open(path, 'rb') as file:
+        header = file.read(24)
+        magic = header[:4]
+        if magic in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1'):
+            endian = '<'
+        elif magic in (b'\xa1\xb2\xc3\xd4', b'\xa1\xb2\x3c\x4d'):
+            endian = '>'
+        else:
+            raise ValueError(f"Not a pcap file: {path}")
+        while True:
+            record = file.read(16)
+            if len(record) < 16:
+                return
+            _, _, captured, _ = struct.unpack(endian + 'IIII', record)
+            yield file.read(captured)
+
+if __name__ == '__main__':
+    for frame in read_pcap(sys.argv[1]):
+        neighbor, ttl = decode_frame(frame, sys.argv[2] if len(sys.argv) > 2 else 'eth0')
+        if neighbor is not None:
+            print(json.dumps(dict(neighbor, ttl=ttl)))
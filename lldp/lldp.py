@@ -1,10 +1,15 @@
+import asyncio
+import inspect
 import subprocess
 import json
+import threading
 from systemd import journal
+from utils.metrics import metrics
 
 
 def hset_init_values():
     return {
+        'interface': '--',
         'chassis_id': '--',
         'chassis_description': '--',
         'management_ip': '--',
@@ -18,25 +23,63 @@ def hset_init_values():
         'power_supported': '--',
         'power_enabled': '--',
         'lldp_med_device_type': '--',
+        'stale': '0',
     }
 
-def lldp(command_runner=subprocess.run):
+NEIGHBORS_KEY = 'LLDP:neighbors'
+
+def lldp_neighbors(command_runner=subprocess.run):
     command = ['lldpcli', 'show', 'neighbors', 'details', '-f', 'json']
     try:
-        result = command_runner(command, text=True, capture_output=True, check=True)
-        lldp = json.loads(result.stdout)
-        lldp_len = len(lldp['lldp'])
+        with metrics.stage('subprocess'):
+            result = command_runner(command, text=True, capture_output=True, check=True)
+        with metrics.stage('parse'):
+            return parse_neighbors(json.loads(result.stdout))
     except subprocess.CalledProcessError as e:
         journal.send(f"LLDP command failed: {e}")
-        return None
+        return []
+    except json.JSONDecodeError as e:
+        journal.send(f"Failed to parse LLDP JSON: {e}")
+        return []
+
+async def lldp_neighbors_async():
+    command = ['lldpcli', 'show', 'neighbors', 'details', '-f', 'json']
+    try:
+        with metrics.stage('subprocess'):
+            process = await asyncio.create_subprocess_exec(*command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = await process.communicate()
+    except OSError as e:
+        journal.send(f"LLDP command failed: {e}")
+        return []
+    if process.returncode != 0:
+        journal.send(f"LLDP command failed with code {process.returncode}: {stderr.decode().strip()}")
+        return []
+    try:
+        with metrics.stage('parse'):
+            return parse_neighbors(json.loads(stdout))
     except json.JSONDecodeError as e:
         journal.send(f"Failed to parse LLDP JSON: {e}")
-        return None
+        return []
+
+def parse_neighbors(lldp):
+    """Flatten every interface and every neighbor into one record each."""
+    body = lldp.get("lldp") if isinstance(lldp, dict) else None
+    if not isinstance(body, dict):
+        return []
+    interfaces = body.get("interface", [])
+    if isinstance(interfaces, dict):
+        interfaces = [interfaces]
+    neighbors = []
+    for entry in interfaces:
+        for name, data in entry.items():
+            if data:
+                neighbors.append(parse_interface(name, data))
+    return neighbors
 
-    if lldp_len == 0:
-        return None
+def neighbor_key(neighbor):
+    return f"LLDP:{neighbor['interface']}:{neighbor['chassis_id']}:{neighbor['port_id']}"
 
-    eth0_data = lldp.get("lldp", {}).get("interface", {}).get("eth0", {})
+def parse_interface(interface, eth0_data):
     chassis = eth0_data.get("chassis", {})
     chassis_subkey = next(iter(chassis), None) if any(isinstance(v, dict) for v in chassis.values()) else None
     chassis_data = chassis.get(chassis_subkey, chassis)
@@ -72,7 +115,11 @@ def lldp(command_runner=subprocess.run):
         available_modes.append(advertised_modes)
     available_modes_str = ",".join(available_modes)
 
-    vlan_id = eth0_data.get("vlan", {}).get("vlan-id", "N/A")
+    vlan = eth0_data.get("vlan", {})
+    if isinstance(vlan, list):
+        vlan_id = ",".join(v.get("vlan-id", "N/A") for v in vlan) or "N/A"
+    else:
+        vlan_id = vlan.get("vlan-id", "N/A")
 
     power_supported = port_data.get("power", {}).get("supported", "N/A")
     power_enabled = port_data.get("power", {}).get("enabled", "N/A")
@@ -81,6 +128,7 @@ def lldp(command_runner=subprocess.run):
     device_type = lldp_med.get("device-type", "N/A")
 
     LLDP = {
+        "interface": interface,
         "chassis_id": chassis_id,
         "chassis_description": chassis_description,
         "management_ip": management_ip,
@@ -97,7 +145,156 @@ def lldp(command_runner=subprocess.run):
     }
     return LLDP
 
-def save_lldp_to_redis(lldp_data, redis_db):
-    if lldp_data is None:
-        lldp_data = hset_init_values()
-    redis_db.hset('LLDP', mapping=lldp_data)
+class LLDPChangeTracker:
+    """Writes only changed LLDP fields and announces them.
+
+    Every neighbor gets its own 'LLDP:<interface>:<chassis>:<port>' hash,
+    listed in the 'LLDP:neighbors' set; the first neighbor on `interface`
+    (the configured lldp_interface) is also mirrored into the 'LLDP' hash.
+    Each change bumps the 'LLDP_version' counter and publishes JSON events
+    ("neighbor_appeared", "field_changed", "neighbor_lost") on the
+    'lldp_events' channel, so readers can skip unchanged state. Neighbors shown from the on-disk
+    cache carry stale='1' until LLDP confirms them, either from
+    stale=True or from their own 'stale' field.
+    """
+    VERSION_KEY = 'LLDP_version'
+    EVENTS_CHANNEL = 'lldp_events'
+
+    def __init__(self, redis_db, interface='eth0'):
+        self.redis_db = redis_db
+        self.interface = interface
+        self.primary = None
+        self.neighbors = None
+        self.lock = threading.Lock()
+
+    def update_neighbors(self, neighbors, stale=False):
+        # readers, the link thread and the expiry task all land here; each diff must see the last one's result
+        with self.lock, metrics.stage('redis'):
+            return self._update_neighbors(neighbors, '1' if stale else '0')
+
+    def _update_neighbors(self, neighbors, stale):
+        current = {neighbor_key(n): dict({'stale': stale}, **n) for n in neighbors}
+        pipe = self.redis_db.pipeline()
+        events = []
+        first = self.neighbors is None
+        if first:
+            self.neighbors = {}
+            for key in self.redis_db.smembers(NEIGHBORS_KEY):
+                pipe.delete(key)
+            pipe.delete(NEIGHBORS_KEY)
+        for key, neighbor in current.items():
+            previous = self.neighbors.get(key)
+            if previous is None:
+                pipe.hset(key, mapping=neighbor)
+                pipe.sadd(NEIGHBORS_KEY, key)
+                events.append({'type': 'neighbor_appeared', 'neighbor': key, 'data': neighbor})
+                continue
+            changed = _changed_fields(previous, neighbor)
+            if changed:
+                pipe.hset(key, mapping=changed)
+                events.extend({'type': 'field_changed', 'neighbor': key, 'field': k, 'old': previous.get(k), 'new': v}
+                              for k, v in changed.items())
+        for key in self.neighbors.keys() - current.keys():
+            pipe.delete(key)
+            pipe.srem(NEIGHBORS_KEY, key)
+            events.append({'type': 'neighbor_lost', 'neighbor': key})
+        primary = next((n for n in current.values() if n['interface'] == self.interface), None) or hset_init_values()
+        changed = _changed_fields(self.primary or {}, primary)
+        if changed:
+            pipe.hset('LLDP', mapping=changed)
+        if not first and not changed and not events:
+            return False
+        pipe.incr(self.VERSION_KEY)
+        version = pipe.execute()[-1]
+        if events:
+            pipe = self.redis_db.pipeline()
+            for event in events:
+                event['version'] = version
+                pipe.publish(self.EVENTS_CHANNEL, json.dumps(event))
+            pipe.execute()
+        self.neighbors = current
+        self.primary = primary
+        return True
+
+def _changed_fields(previous, current):
+    return {k: v for k, v in current.items() if previous.get(k) != v}
+
+async def lldp_watch_async(on_update):
+    """Stream neighbor events from one long-lived `lldpcli watch` process.
+
+    Every (re)start is seeded with a full lldp_neighbors_async() read,
+    because watch only reports changes; on_update always receives the
+    complete neighbor list. Returns False if lldpcli watch can't be
+    started at all, so the caller can fall back to polling; otherwise it
+    runs until the task is cancelled.
+
+    If on_update returns an awaitable (a blocking update handed to a
+    worker thread), it is awaited before the next event is read.
+    """
+    command = ['lldpcli', 'watch', '-f', 'json']
+    decoder = json.JSONDecoder()
+    while True:
+        try:
+            process = await asyncio.create_subprocess_exec(*command, stdout=subprocess.PIPE,
+                                                           stderr=subprocess.DEVNULL, limit=1 << 20)
+        except OSError as e:
+            journal.send(f"LLDP watch failed to start: {e}")
+            return False
+        try:
+            neighbors = {neighbor_key(n): n for n in await lldp_neighbors_async()}
+            await _maybe_await(on_update(list(neighbors.values())))
+            parts = []
+            async for line in process.stdout:
+                with metrics.loop('lldp_watch'):
+                    with metrics.stage('parse'):
+                        events = _decode_watch_line(decoder, parts, line.decode())
+                        _apply_watch_events(neighbors, events)
+                    if events:
+                        await _maybe_await(on_update(list(neighbors.values())))
+        finally:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+        journal.send(f"LLDP watch exited with code {process.returncode}, restarting")
+        await asyncio.sleep(1)
+
+async def _maybe_await(result):
+    if inspect.isawaitable(result):
+        await result
+
+def _apply_watch_events(neighbors, events):
+    for event in events:
+        for tag, body in event.items():
+            for neighbor in parse_neighbors({"lldp": body}):
+                if tag == "lldp-deleted":
+                    neighbors.pop(neighbor_key(neighbor), None)
+                else:
+                    neighbors[neighbor_key(neighbor)] = neighbor
+
+def _decode_watch_line(decoder, parts, line):
+    """Buffer one line of `lldpcli watch` output and return the events it completes.
+
+    lldpcli indents everything inside an event, so only a line starting at
+    column 0 and ending in '}' can close one; the buffer is decoded then
+    and only then, which keeps a large event linear in its size.
+    """
+    parts.append(line)
+    if line[:1].isspace() or not line.rstrip().endswith('}'):
+        return []
+    buffer, events = _decode_watch_events(decoder, ''.join(parts))
+    parts[:] = [buffer] if buffer else []
+    return events
+
+def _decode_watch_events(decoder, buffer):
+    events = []
+    while True:
+        buffer = buffer.lstrip()
+        if not buffer:
+            return buffer, events
+        try:
+            event, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            return buffer, events
+        if isinstance(event, dict):
+            events.append(event)
+        buffer = buffer[end:]
@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from time import monotonic, time
+from systemd import journal
+
+class NeighborCache:
+    """Known neighbors on disk, keyed by chassis ID and port ID.
+
+    The file is append-only JSON lines ({"k": key, "t": seen, "n": record});
+    the last line for a key wins and a torn last line is skipped. A line is
+    only appended when a neighbor's data changed or it became the latest
+    one on its interface, so a steady link writes nothing. Past
+    `max_entries` the least recently seen neighbors are evicted, and the
+    file is rewritten once it holds more than twice as many lines as live
+    entries.
+    """
+    def __init__(self, path, max_entries=256, clock=time):
+        self.path = path
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.latest = {}
+        self.lines = 0
+        self.load()
+
+    @staticmethod
+    def key(neighbor):
+        return f"{neighbor['chassis_id']}|{neighbor['port_id']}"
+
+    def load(self):
+        try:
+            with open(self.path) as file:
+                for line in file:
+                    self.lines += 1
+                    try:
+                        entry = json.loads(line)
+                        self._store(entry['k'], entry['t'], entry['n'])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            journal.send(f"Can't read neighbor cache {self.path}: {e}")
+            return
+        self._evict()
+        if self.lines > 2 * len(self.entries):
+            self.compact()
+
+    def _store(self, key, seen, neighbor):
+        self.entries[key] = (seen, neighbor)
+        self.entries.move_to_end(key)
+        self.latest[neighbor['interface']] = key
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            key, (_, neighbor) = self.entries.popitem(last=False)
+            if self.latest.get(neighbor['interface']) == key:
+                del self.latest[neighbor['interface']]
+
+    def record(self, neighbors):
+        appended = []
+        now = round(self.clock())
+        for neighbor in neighbors:
+            key = self.key(neighbor)
+            cached = self.entries.get(key)
+            if cached is None or cached[1] != neighbor or self.latest.get(neighbor['interface']) != key:
+                appended.append(json.dumps({'k': key, 't': now, 'n': neighbor}, separators=(',', ':')))
+            self._store(key, now, neighbor)
+        self._evict()
+        if not appended:
+            return
+        try:
+            with open(self.path, 'a') as file:
+                file.write('\n'.join(appended) + '\n')
+            self.lines += len(appended)
+        except OSError as e:
+            journal.send(f"Can't write neighbor cache {self.path}: {e}")
+            return
+        if self.lines > 2 * len(self.entries):
+            self.compact()
+
+    def compact(self):
+        tmp_path = f'{self.path}.tmp'
+        try:
+            with open(tmp_path, 'w') as file:
+                for key, (seen, neighbor) in self.entries.items():
+                    file.write(json.dumps({'k': key, 't': seen, 'n': neighbor}, separators=(',', ':')) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+            self.lines = len(self.entries)
+        except OSError as e:
+            journal.send(f"Can't compact neighbor cache {self.path}: {e}")
+
+    def last(self, interface):
+        key = self.latest.get(interface)
+        return None if key is None else dict(self.entries[key][1])
+
+class WarmNeighbors:
+    """Shows the last known neighbor as stale until LLDP confirms it.
+
+    Readers report the complete neighbor list of every interface; link
+    events only touch the interface that changed. warm() puts the cached
+    neighbor of an interface on screen right away, marked stale, and it
+    stays there for `hold` seconds while reads find nothing on that
+    interface, since the switch may not have sent its LLDPDU yet. The
+    first real read for the interface replaces it and is recorded in the
+    cache; expire() removes it if none came, and clear() drops whatever
+    the interface had. Every non-empty read is also passed to the
+    `on_fresh` callbacks, and `on_link` callbacks get the interface on
+    every warm() and clear() so readers that keep their own state (capture
+    mode) can forget it. Readers, the link thread and the expiry task call
+    in from different threads, so every update is taken under one lock.
+    """
+    def __init__(self, tracker, cache=None, hold=35, clock=monotonic):
+        self.tracker = tracker
+        self.cache = cache
+        self.hold = hold
+        self.clock = clock
+        self.read = []
+        self.held = {}
+        self.down = set()
+        self.on_fresh = []
+        self.on_link = []
+        self.lock = threading.RLock()
+
+    def warm(self, interface='eth0'):
+        with self.lock:
+            self.down.discard(interface)
+            for callback in self.on_link:
+                callback(interface)
+            neighbor = self.cache.last(interface) if self.cache is not None else None
+            if neighbor is None:
+                return False
+            self.held[interface] = (self.clock() + self.hold, dict(neighbor, stale='1'))
+            self._publish()
+            return True
+
+    def update_neighbors(self, neighbors):
+        with self.lock:
+            fresh = {n['interface'] for n in neighbors}
+            for interface in fresh & self.held.keys():
+                del self.held[interface]
+            if neighbors:
+                if self.cache is not None:
+                    self.cache.record(neighbors)
+                for callback in self.on_fresh:
+                    callback(neighbors)
+            self.read = list(neighbors)
+            return self._publish()
+
+    def expire(self):
+        """Drop cached neighbors once `hold` passed without a fresh read; run periodically."""
+        with self.lock:
+            now = self.clock()
+            expired = [interface for interface, (until, _) in self.held.items() if until <= now]
+            if not expired:
+                return False
+            for interface in expired:
+                del self.held[interface]
+            return self._publish()
+
+    def clear(self, interface='eth0'):
+        """Carrier lost: hide the interface's neighbors until warm() is called for it again."""
+        with self.lock:
+            self.held.pop(interface, None)
+            self.down.add(interface)
+            for callback in self.on_link:
+                callback(interface)
+            return self._publish()
+
+    def _publish(self):
+        neighbors = [n for n in self.read if n['interface'] not in self.down and n['interface'] not in self.held]
+        neighbors += [neighbor for _, neighbor in self.held.values()]
+        return self.tracker.update_neighbors(neighbors)
@@ -0,0 +1,197 @@
+"""Site-survey store: python3 -m lldp.survey [filters] [--format csv|json|jsonl] [--out file]"""
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from time import monotonic, time
+from systemd import journal
+
+from .lldp import hset_init_values
+
+FIELDS = [k for k in hset_init_values() if k != 'stale']
+BATTERY_FIELDS = ['battery_power', 'battery_voltage', 'battery_charging']
+COLUMNS = ['id', 'time'] + FIELDS + BATTERY_FIELDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    interface TEXT,
+    chassis_id TEXT,
+    port_id TEXT,
+    vlan_id TEXT,
+    management_ip TEXT,
+    battery_power REAL,
+    battery_voltage REAL,
+    battery_charging INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS readings_ts ON readings (ts);
+CREATE INDEX IF NOT EXISTS readings_chassis_id ON readings (chassis_id);
+CREATE INDEX IF NOT EXISTS readings_port_id ON readings (port_id);
+CREATE INDEX IF NOT EXISTS readings_vlan_id ON readings (vlan_id);
+CREATE INDEX IF NOT EXISTS readings_management_ip ON readings (management_ip);
+"""
+
+FILTERS = {
+    'chassis_id': 'chassis_id = ?',
+    'port_id': 'port_id = ?',
+    'vlan_id': 'vlan_id = ?',
+    'management_ip': 'management_ip = ?',
+    'since': 'ts >= ?',
+    'until': 'ts < ?',
+}
+
+def battery_state(redis_db):
+    power, voltage, charging = redis_db.mget(BATTERY_FIELDS)
+    return {
+        'battery_power': None if power is None else float(power),
+        'battery_voltage': None if voltage is None else float(voltage),
+        'battery_charging': None if charging is None else int(charging),
+    }
+
+class SurveyStore:
+    """Appends each distinct LLDP reading to a SQLite database.
+
+    Readings identical to the last one stored for the same chassis and
+    port are dropped. The rest are buffered and written in one
+    transaction once `batch_size` rows are pending or `flush_interval`
+    seconds have passed, so the SD card sees a few large writes instead
+    of one per read.
+    """
+    def __init__(self, path, batch_size=50, flush_interval=30, remember=4096, clock=monotonic):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.remember = remember
+        self.clock = clock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.pending = []
+        self.last = OrderedDict()
+        self.flushed_at = clock()
+
+    def record(self, neighbors, battery=None, timestamp=None):
+        battery = battery or {}
+        timestamp = timestamp or time()
+        with self.lock:
+            for neighbor in neighbors:
+                data = {k: v for k, v in neighbor.items() if k != 'stale'}
+                key = (data.get('chassis_id'), data.get('port_id'))
+                if self.last.get(key) == data:
+                    self.last.move_to_end(key)
+                    continue
+                self.last[key] = data
+                self.last.move_to_end(key)
+                if len(self.last) > self.remember:
+                    self.last.popitem(last=False)
+                self.pending.append((timestamp, data.get('interface'), data.get('chassis_id'), data.get('port_id'),
+                                     data.get('vlan_id'), data.get('management_ip'), battery.get('battery_power'),
+                                     battery.get('battery_voltage'), battery.get('battery_charging'),
+                                     json.dumps(data, separators=(',', ':'))))
+            due = len(self.pending) >= self.batch_size or self.clock() - self.flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.flushed_at = self.clock()
+            if not self.pending:
+                return 0
+            rows, self.pending = self.pending, []
+            try:
+                with self.db:
+                    self.db.executemany(
+                        'INSERT INTO readings (ts, interface, chassis_id, port_id, vlan_id, management_ip, '
+                        'battery_power, battery_voltage, battery_charging, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        rows)
+            except sqlite3.Error as e:
+                journal.send(f"Survey write failed, {len(rows)} readings lost: {e}")
+                return 0
+            return len(rows)
+
+    def query(self, limit=None, **filters):
+        """Yield matching readings oldest first, fetched in chunks."""
+        clauses, params = [], []
+        for name, value in filters.items():
+            if value is not None:
+                clauses.append(FILTERS[name])
+                params.append(value)
+        sql = 'SELECT id, ts, battery_power, battery_voltage, battery_charging, data FROM readings'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY ts, id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        cursor = self.db.cursor()
+        cursor.arraysize = 500
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            for row_id, ts, power, voltage, charging, data in rows:
+                reading = {'id': row_id, 'time': datetime.fromtimestamp(ts).isoformat(timespec='seconds')}
+                reading.update(json.loads(data))
+                reading.update(battery_power=power, battery_voltage=voltage, battery_charging=charging)
+                yield reading
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+def export_csv(readings, file):
+    writer = csv.DictWriter(file, COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for reading in readings:
+        writer.writerow(reading)
+
+def export_json(readings, file):
+    file.write('[')
+    for i, reading in enumerate(readings):
+        file.write(',\n' if i else '\n')
+        file.write(json.dumps(reading))
+    file.write('\n]\n')
+
+def export_jsonl(readings, file):
+    for reading in readings:
+        file.write(json.dumps(reading) + '\n')
+
+EXPORTERS = {'csv': export_csv, 'json': export_json, 'jsonl': export_jsonl}
+
+def timestamp(value):
+    return datetime.fromisoformat(value).timestamp()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db', default='/var/lib/rpint/survey.db')
+    parser.add_argument('--chassis-id')
+    parser.add_argument('--port-id')
+    parser.add_argument('--vlan-id')
+    parser.add_argument('--management-ip')
+    parser.add_argument('--since', type=timestamp, help='ISO date or time, e.g. 2024-05-01')
+    parser.add_argument('--until', type=timestamp)
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--format', choices=EXPORTERS, default='csv')
+    parser.add_argument('--out', help='write to this file instead of stdout')
+    args = parser.parse_args()
+    store = SurveyStore(args.db)
+    readings = store.query(args.limit, chassis_id=args.chassis_id, port_id=args.port_id, vlan_id=args.vlan_id,
+                           management_ip=args.management_ip, since=args.since, until=args.until)
+    if args.out:
+        with open(args.out, 'w', newline='') as file:
+            EXPORTERS[args.format](readings, file)
+    else:
+        EXPORTERS[args.format](readings, sys.stdout)
+    store.db.close()
+
+if __name__ == '__main__':
+    main()
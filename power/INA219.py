@@ -1,4 +1,4 @@
-from smbus2 import SMBus
+from collections import namedtuple
 import time
 
 # Config Register (R/W)
@@ -44,6 +44,10 @@ class ADCResolution:
     ADCRES_12BIT_64S        = 0x0E      # 12bit,  64 samples, 34.05ms
     ADCRES_12BIT_128S       = 0x0F      # 12bit, 128 samples, 68.10ms
 
+# seconds per conversion for each ADCResolution value
+CONVERSION_TIME = {0x00: 84e-6, 0x01: 148e-6, 0x02: 276e-6, 0x03: 532e-6, 0x08: 532e-6, 0x09: 1.06e-3,
+                   0x0A: 2.13e-3, 0x0B: 4.26e-3, 0x0C: 8.51e-3, 0x0D: 17.02e-3, 0x0E: 34.05e-3, 0x0F: 68.10e-3}
+
 class Mode:
     """Constants for ``mode``"""
     POWERDOW                = 0x00      # power down
@@ -56,9 +60,15 @@ class Mode:
     SANDBVOLT_CONTINUOUS    = 0x07      # shunt and bus voltage continuous
 
 
+INA219Sample = namedtuple('INA219Sample', ['bus_voltage_V', 'shunt_voltage_mV', 'current_mA', 'power_W'])
+
+
 class INA219:
-    def __init__(self, i2c_bus=1, addr=0x40):
-        self.bus = SMBus(i2c_bus);
+    def __init__(self, i2c_bus=1, addr=0x40, bus=None):
+        if bus is None:
+            from smbus2 import SMBus
+            bus = SMBus(i2c_bus)
+        self.bus = bus
         self.addr = addr
 
         # Set chip to known config values to start
@@ -187,3 +197,48 @@ class INA219:
         if value > 32767:
             value -= 65535
         return value * self._power_lsb
+
+    def set_mode(self, mode):
+        """Rewrite the config register with a new operating mode."""
+        self.mode = mode
+        self.config = (self.config & ~0x07) | mode
+        self.write(_REG_CONFIG, self.config)
+
+    def conversion_time(self):
+        """Seconds one shunt+bus conversion takes with the current ADC settings."""
+        return CONVERSION_TIME[self.bus_adc_resolution] + CONVERSION_TIME[self.shunt_adc_resolution]
+
+    def trigger(self):
+        """Start one shunt+bus conversion; returns the seconds to wait before collect()."""
+        self.set_mode(Mode.SANDBVOLT_TRIGGERED)
+        return self.conversion_time()
+
+    def collect(self):
+        """Read bus voltage, shunt voltage, current and power: four register reads.
+
+        If the chip lost its calibration (current and power read back as
+        zero while the shunt voltage is not), it is rewritten and this
+        sample's current and power are computed from the raw shunt and bus
+        values with the datasheet formulas instead of waiting for another
+        conversion.
+        """
+        bus = self.read(_REG_BUSVOLTAGE)
+        shunt = self._signed(self.read(_REG_SHUNTVOLTAGE))
+        current = self._signed(self.read(_REG_CURRENT))
+        power = self._signed(self.read(_REG_POWER))
+        if shunt and not current and not power:
+            self.write(_REG_CALIBRATION, self._cal_value)
+            current = int(shunt * self._cal_value / 4096)
+            power = int(abs(current) * (bus >> 3) / 5000)
+        return INA219Sample((bus >> 3) * 0.004, shunt * 0.01, current * self._current_lsb, power * self._power_lsb)
+
+    def sample(self, triggered=False, sleep=time.sleep):
+        """One reading. Triggered mode adds one config write and a single
+        sleep for the conversion time; the ADC idles again afterwards."""
+        if triggered:
+            sleep(self.trigger())
+        return self.collect()
+
+    @staticmethod
+    def _signed(value):
+        return value - 65536 if value > 32767 else value
@@ -0,0 +1,17 @@
+class FakeSMBus:
+    """In-memory SMBus stand-in for an INA219; counts I2C transactions."""
+    def __init__(self, registers=None):
+        self.registers = dict(registers or {})
+        self.reads = 0
+        self.writes = 0
+
+    def read_i2c_block_data(self, addr, register, length):
+        self.reads += 1
+        value = self.registers.get(register, 0)
+        if register == 0x02:
+            value |= 0x02
+        return [(value >> 8) & 0xFF, value & 0xFF][:length]
+
+    def write_i2c_block_data(self, addr, register, data):
+        self.writes += 1
+        self.registers[register] = (data[0] << 8) | data[1]
@@ -0,0 +1,117 @@
+from time import monotonic
+from systemd import journal
+
+class PowerGovernor:
+    """Switches between the power profiles defined in rpint.toml.
+
+    "active" runs while buttons are being pressed or the link or LLDP
+    data changed within `power_idle_after` seconds, or whenever the UPS
+    is charging. Otherwise "idle" is used, and "critical" once the
+    battery drops to `power_critical_charge` percent. A profile sets the
+    periods of the scheduler tasks; a refresh rate of 0 stops rendering
+    and switches the panel off. The mean load measured in each profile
+    is kept in the `power` Redis hash.
+    """
+    HYSTERESIS = 2
+
+    def __init__(self, context, scheduler, monitor=None, display=None, clock=monotonic):
+        self.context = context
+        self.scheduler = scheduler
+        self.monitor = monitor
+        self.display = display
+        self.clock = clock
+        self.profile = None
+        self.configure()
+        self.last_activity = clock()
+        self.seen = None
+        self.usage = {}
+        self.reported = None
+        self._accounted = clock()
+
+    def configure(self):
+        """Re-read the profiles and thresholds and re-apply the current profile."""
+        config = self.context.config
+        self.profiles = config.get('power_profiles', {})
+        self.idle_after = config.get('power_idle_after', 60)
+        self.critical_charge = config.get('power_critical_charge', 5)
+        if self.profile is not None:
+            for task, period in self.periods(self.profiles.get(self.profile, {})).items():
+                self.scheduler.set_period(task, period)
+
+    def wrap(self, callback):
+        def handler():
+            callback()
+            self.touch()
+        handler.__name__ = getattr(callback, '__name__', 'handler')
+        return handler
+
+    def touch(self):
+        self.last_activity = self.clock()
+        self.scheduler.wake('governor')
+
+    def periods(self, profile):
+        config = self.context.config
+        rate = profile.get('serial_display_refresh_rate', config.get('serial_display_refresh_rate', 5))
+        return {
+            'display': 1 / rate if rate else None,
+            'lldp': profile.get('lldp_poll_period', config.get('lldp_poll_period', 2)),
+            'ups': profile.get('ups_hat_period', config.get('ups_hat_period', 1)),
+        }
+
+    def choose(self):
+        telemetry = self.monitor.telemetry if self.monitor is not None else None
+        if telemetry is None or telemetry.charge is None or telemetry.charging:
+            return 'active'
+        critical = self.critical_charge + (self.HYSTERESIS if self.profile == 'critical' else 0)
+        if telemetry.charge <= critical:
+            return 'critical'
+        if self.clock() - self.last_activity >= self.idle_after:
+            return 'idle'
+        return 'active'
+
+    def step(self):
+        redis_db = self.context.redis_db
+        seen = (redis_db.get('LLDP_version'), redis_db.get('link_state'))
+        if seen != self.seen:
+            self.seen = seen
+            self.last_activity = self.clock()
+        self.account()
+        profile = self.choose()
+        if profile != self.profile:
+            self.apply(profile)
+        self.report()
+
+    def account(self):
+        now = self.clock()
+        telemetry = self.monitor.telemetry if self.monitor is not None else None
+        if self.profile is not None and telemetry is not None and telemetry.load is not None:
+            usage = self.usage.setdefault(self.profile, [0.0, 0.0])
+            usage[0] += now - self._accounted
+            usage[1] += telemetry.load * (now - self._accounted)
+        self._accounted = now
+
+    def apply(self, name):
+        periods = self.periods(self.profiles.get(name, {}))
+        for task, period in periods.items():
+            self.scheduler.set_period(task, period)
+        if self.display is not None:
+            if periods['display'] is None:
+                self.display.sleep()
+            elif self.profile is not None and self.display.asleep:
+                self.display.wake()
+        journal.send(f"Power profile {self.profile or '-'} -> {name}")
+        self.profile = name
+
+    def report(self):
+        mapping = {'profile': self.profile}
+        for name, (seconds, joules) in self.usage.items():
+            mapping[f'{name}_s'] = round(seconds)
+            mapping[f'{name}_W'] = round(joules / seconds, 3) if seconds else 0
+        # the *_s counters grow on every report; only a new profile or draw is a change worth announcing
+        shown = {k: round(v, 2) if k.endswith('_W') else v for k, v in mapping.items() if not k.endswith('_s')}
+        pipe = self.context.redis_db.pipeline()
+        pipe.hset('power', mapping=mapping)
+        if shown != self.reported:
+            self.reported = shown
+            pipe.incr('power_version')
+        pipe.execute()
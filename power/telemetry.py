@@ -0,0 +1,94 @@
+from array import array
+from bisect import bisect_left
+
+# Single Li-ion cell open-circuit voltage -> state of charge (%)
+DISCHARGE_CURVE = [
+    (3.00, 0), (3.40, 5), (3.55, 10), (3.65, 20), (3.70, 30), (3.75, 40),
+    (3.80, 50), (3.85, 60), (3.92, 70), (4.00, 80), (4.10, 90), (4.20, 100),
+]
+
+def charge_from_voltage(voltage, curve=DISCHARGE_CURVE):
+    voltages = [v for v, _ in curve]
+    i = bisect_left(voltages, voltage)
+    if i == 0:
+        return curve[0][1]
+    if i == len(curve):
+        return curve[-1][1]
+    (v0, c0), (v1, c1) = curve[i - 1], curve[i]
+    return c0 + (c1 - c0) * (voltage - v0) / (v1 - v0)
+
+class BatteryTelemetry:
+    """Fixed-size history of UPS samples with smoothing and runtime estimate.
+
+    Samples are averaged into per-minute buckets kept in an array-backed
+    ring of `buckets` entries, so memory does not grow with uptime. Voltage, load and current are smoothed with an
+    EWMA; charge comes from the discharge curve and time to empty from
+    the remaining energy over the smoothed load.
+    """
+    def __init__(self, buckets=60, bucket_seconds=60, alpha=0.2, battery_Wh=3.7):
+        self.alpha = alpha
+        self.battery_Wh = battery_Wh
+        self.bucket_seconds = bucket_seconds
+        self.bucket_times = array('d', [0.0] * buckets)
+        self.bucket_voltages = array('d', [0.0] * buckets)
+        self.bucket_loads = array('d', [0.0] * buckets)
+        self.bucket_index = 0
+        self.bucket_count = 0
+        self._bucket_start = None
+        self._bucket_sum_voltage = 0.0
+        self._bucket_sum_load = 0.0
+        self._bucket_samples = 0
+        self.voltage = None
+        self.load = None
+        self.current = None
+
+    def add(self, timestamp, voltage, load, current=0.0):
+        """Record one sample; returns True when a minute bucket was closed."""
+        if self.voltage is None:
+            self.voltage, self.load, self.current = voltage, load, current
+        else:
+            a = self.alpha
+            self.voltage += a * (voltage - self.voltage)
+            self.load += a * (load - self.load)
+            self.current += a * (current - self.current)
+        closed = False
+        if self._bucket_start is None:
+            self._bucket_start = timestamp
+        elif timestamp - self._bucket_start >= self.bucket_seconds:
+            self._close_bucket()
+            self._bucket_start = timestamp
+            closed = True
+        self._bucket_sum_voltage += voltage
+        self._bucket_sum_load += load
+        self._bucket_samples += 1
+        return closed
+
+    def _close_bucket(self):
+        i = self.bucket_index
+        self.bucket_times[i] = self._bucket_start
+        self.bucket_voltages[i] = self._bucket_sum_voltage / self._bucket_samples
+        self.bucket_loads[i] = self._bucket_sum_load / self._bucket_samples
+        self.bucket_index = (i + 1) % len(self.bucket_times)
+        self.bucket_count = min(self.bucket_count + 1, len(self.bucket_times))
+        self._bucket_sum_voltage = self._bucket_sum_load = 0.0
+        self._bucket_samples = 0
+
+    def history(self):
+        size = len(self.bucket_times)
+        start = (self.bucket_index - self.bucket_count) % size
+        return [(self.bucket_times[(start + i) % size], round(self.bucket_voltages[(start + i) % size], 3),
+                 round(self.bucket_loads[(start + i) % size], 3)) for i in range(self.bucket_count)]
+
+    @property
+    def charge(self):
+        return None if self.voltage is None else charge_from_voltage(self.voltage)
+
+    @property
+    def charging(self):
+        return self.current is not None and self.current > 0
+
+    def time_to_empty(self):
+        """Remaining runtime in minutes at the smoothed load, or None."""
+        if self.voltage is None or self.charging or not self.load or self.load <= 0:
+            return None
+        return self.battery_Wh * self.charge / 100 / self.load * 60
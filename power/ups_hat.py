@@ -1,17 +1,34 @@
-from time import sleep
+import json
+from time import time
+from utils.metrics import metrics
 
-def ups_hat(context):
-    from .INA219 import INA219
-    ina219 = INA219(addr=0x43)
-    V_FULL = 4.2
-    V_EMPTY = 3.0
-    while not context.stop_event.is_set():
-        bus_voltage = ina219.getBusVoltage_V()
-        power = ina219.getPower_W()
-        charge_level = max(0, min(100, ((bus_voltage - V_EMPTY) / (V_FULL - V_EMPTY)) * 100))
-        pipe = context.redis_db.pipeline()
-        pipe.set('battery_power', round(charge_level))
-        pipe.set('battery_voltage', round(bus_voltage, 2))
-        pipe.set('battery_load', round(power, 2))
-        pipe.execute()
-        sleep(1)
+class UPSMonitor:
+    """One UPS HAT reading per step(), published to Redis."""
+    def __init__(self, context, ina219=None):
+        from .INA219 import INA219
+        from .telemetry import BatteryTelemetry
+        self.context = context
+        self.ina219 = ina219 or INA219(addr=0x43)
+        self.triggered = context.config.get('ups_hat_sample_mode', 'triggered') == 'triggered'
+        battery_Wh = context.config.get('battery_capacity_mAh', 1000) * 3.7 / 1000
+        self.telemetry = BatteryTelemetry(battery_Wh=battery_Wh)
+
+    def step(self):
+        with metrics.stage('i2c'):
+            sample = self.ina219.sample(triggered=self.triggered)
+        self.publish(sample)
+
+    def publish(self, sample):
+        telemetry = self.telemetry
+        bucket_closed = telemetry.add(time(), sample.bus_voltage_V, sample.power_W, sample.current_mA)
+        time_to_empty = telemetry.time_to_empty()
+        with metrics.stage('redis'):
+            pipe = self.context.redis_db.pipeline()
+            pipe.set('battery_power', round(telemetry.charge))
+            pipe.set('battery_voltage', round(telemetry.voltage, 2))
+            pipe.set('battery_load', round(telemetry.load, 2))
+            pipe.set('battery_charging', int(telemetry.charging))
+            pipe.set('battery_time_to_empty', '--' if time_to_empty is None else round(time_to_empty))
+            if bucket_closed:
+                pipe.set('battery_history', json.dumps(telemetry.history()))
+            pipe.execute()
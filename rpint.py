@@ -1,63 +1,256 @@
+from time import monotonic
+STARTED = monotonic()
 import os
 import signal
-from gpiozero.pins.rpigpio import RPiGPIOFactory
-from gpiozero import Button
-from signal import pause
 import threading
 import sys
 from systemd import journal
 
 from app_context import AppContext
 from utils.config import config_load
-from utils.redis_utils import db_connect
+from utils.metrics import metrics, export_metrics, SamplingProfiler
+from utils.startup import StartupTimer
 from utils.threading_utils import threading_function
-from lldp.lldp import lldp, save_lldp_to_redis
-from display.controller import DisplayController
-from power.ups_hat import ups_hat
 
 def shutdown():
     from subprocess import check_call
     check_call(['sudo', 'poweroff'])
 
-def lldp_worker(context: AppContext):
-    from time import sleep
+def neighbor_tracker(context: AppContext):
+    from lldp.lldp import LLDPChangeTracker
+    from lldp.neighbor_cache import NeighborCache, WarmNeighbors
+    config = context.config
+    cache = None
+    if bool(config.get('neighbor_cache', True)):
+        cache = NeighborCache(config.get('neighbor_cache_path', '/var/lib/rpint/neighbors.jsonl'),
+                              config.get('neighbor_cache_size', 256))
+    tracker = LLDPChangeTracker(context.redis_db, config.get('lldp_interface', 'eth0'))
+    return WarmNeighbors(tracker, cache, config.get('lldp_fast_timeout', 35))
+
+def lldp_poller(tracker, runtime):
+    from lldp.lldp import lldp_neighbors_async
+    async def lldp_poll():
+        # Redis writes, the neighbor cache file and the survey all sit behind update_neighbors
+        await runtime.blocking(tracker.update_neighbors, await lldp_neighbors_async())
+    return lldp_poll
+
+async def lldp_watch_task(context: AppContext, tracker, runtime):
+    from lldp.lldp import lldp_watch_async
+    if not await lldp_watch_async(lambda neighbors: runtime.blocking(tracker.update_neighbors, neighbors)):
+        journal.send("Falling back to LLDP polling")
+        runtime.every('lldp', context.config.get('lldp_poll_period', 2), lldp_poller(tracker, runtime))
+
+def lldp_capture_worker(context: AppContext, tracker, runtime):
+    from functools import partial
+    from queue import SimpleQueue
+    from lldp.capture import lldp_capture
+    interfaces = tuple(context.config.get('lldp_capture_interfaces', ['eth0']))
+    resets = SimpleQueue()
+    tracker.on_link.append(resets.put)
+    started = lldp_capture(tracker.update_neighbors, context.stop_event, interfaces, resets=resets)
+    if not started:
+        journal.send("Falling back to LLDP watch")
+        runtime.dispatch(partial(lldp_watch_task, context, tracker, runtime))()
+
+def lldp_link_worker(context: AppContext, tracker, link_source=None, clock=monotonic):
+    from utils.netlink import NetlinkLinkSource
+    from lldp.lldp import lldp_neighbors
+    interface = context.config.get('lldp_interface', 'eth0')
+    if link_source is None:
+        link_source = NetlinkLinkSource(interface)
+    carrier = None
+    next_read = fast_until = 0
+    state = link_source.carrier()
     while not context.stop_event.is_set():
-        lldp_data = lldp()
-        save_lldp_to_redis(lldp_data, context.redis_db)
-        sleep(2)
+        config = context.config
+        fast_interval = config.get('lldp_fast_interval', 0.5)
+        fast_timeout = config.get('lldp_fast_timeout', 35)
+        slow_interval = config.get('lldp_slow_interval', 30)
+        if state is not None and state != carrier:
+            carrier = state
+            context.redis_db.set('link_state', 'up' if carrier else 'down')
+            fast_until = next_read = clock()
+            fast_until += fast_timeout
+            if carrier:
+                tracker.warm(interface)
+            else:
+                tracker.clear(interface)
+        if carrier and clock() >= next_read:
+            with metrics.loop('lldp'):
+                neighbors = lldp_neighbors()
+                tracker.update_neighbors(neighbors)
+            next_read = clock() + (fast_interval if not neighbors and clock() < fast_until else slow_interval)
+        # wake at least once a second to notice stop_event
+        timeout = min(1, max(0, next_read - clock())) if carrier else 1
+        state = link_source.wait(timeout)
+    link_source.close()
 
-def signal_handler(sig, frame, context: AppContext):
-    error = f"Received termination signal, stopping threads..."
-    journal.send(error)
-    context.stop_event.set()
-    journal.send(f"All threads have been signaled to stop.")
-    sys.exit(error)
+def link_watcher(context: AppContext, tracker, link_source=None):
+    """Carrier events for the read modes that don't follow the link themselves."""
+    from utils.netlink import NetlinkLinkSource
+    interface = context.config.get('lldp_interface', 'eth0')
+    if link_source is None:
+        link_source = NetlinkLinkSource(interface)
+    while not context.stop_event.is_set():
+        state = link_source.wait(1)
+        if state is None:
+            continue
+        context.redis_db.set('link_state', 'up' if state else 'down')
+        if state:
+            tracker.warm(interface)
+        else:
+            tracker.clear(interface)
+    link_source.close()
+
+# read once at startup; a reload only logs that these changed
+RESTART_KEYS = (
+    'redis_host', 'redis_unix_socket', 'use_serial_display', 'use_ups_hat', 'auto_lldp_read', 'lldp_read_mode',
+    'lldp_interface', 'lldp_capture_interfaces', 'serial_display_type', 'serial_display_width',
+    'serial_display_height', 'serial_display_rotate', 'serial_display_horizontal_offset',
+    'serial_display_vertical_offset', 'serial_display_background', 'serial_display_partial_update',
+    'neighbor_cache', 'neighbor_cache_path', 'survey', 'survey_path', 'metrics', 'power_governor', 'timer_slack',
+    'http_api', 'http_api_host', 'http_api_port', 'http_api_push_interval', 'http_api_max_clients',
+    'linktest_peer', 'linktest_reflector', 'redis_client_cache', 'ups_hat_sample_mode', 'battery_capacity_mAh',
+    'lldp_fast_timeout',
+)
+
+def task_periods(config):
+    return {
+        'display': 1 / config.get('serial_display_refresh_rate', 5),
+        'ups': config.get('ups_hat_period', 1),
+        'lldp': config.get('lldp_poll_period', 2),
+        'metrics': config.get('metrics_interval', 10),
+        'survey': config.get('survey_flush_interval', 30),
+        'governor': config.get('power_governor_interval', 5),
+    }
+
+def reload_config(path, context: AppContext, runtime, display_controller=None, governor=None):
+    """SIGHUP: re-read rpint.toml and apply it without restarting anything."""
+    from utils.config import config_read
+    try:
+        config = config_read(path)['setup']
+        periods = task_periods(config)
+        plan = None
+        if display_controller is not None:
+            from display.plan import compile_plan
+            plan = compile_plan(config, context.font_path)
+    except (OSError, ValueError, KeyError, ZeroDivisionError) as e:
+        journal.send(f"Config reload failed, keeping the current settings: {e}")
+        return False
+    changed = [key for key in RESTART_KEYS if config.get(key) != context.config.get(key)]
+    context.config = config
+    if plan is not None:
+        display_controller.set_plan(plan)
+    for task, period in periods.items():
+        runtime.scheduler.set_period(task, period)
+    if governor is not None:
+        governor.configure()
+    journal.send(f"Config reloaded from {path}")
+    if changed:
+        journal.send(f"Restart RPiNT to apply: {', '.join(changed)}")
+    return True
 
 def main():
     print('\n# RPiNT is running #\n')
+    timer = StartupTimer(STARTED)
     CONFIG_PATH = os.getenv('RPINT_CONFIG_PATH', '/home/pi/scripts/RPiNT/rpint.toml')
     FONT_PATH = os.getenv('RPINT_FONT_PATH', '/home/pi/scripts/RPiNT/fonts/FreePixel.ttf')
     stop_threads = threading.Event()
-    redis_db = db_connect('localhost', 0)
-    redis_db.flushdb()
     config_full = config_load(CONFIG_PATH)
     config = config_full['setup']
-    context = AppContext(config, FONT_PATH, redis_db, stop_threads)
-    button_up = Button(6)
-    button_down = Button(19)
-    button_left = Button(5)
-    button_right = Button(26)
+    context = AppContext(config, FONT_PATH, None, stop_threads)
+    timer.mark('config')
+    display_controller = None
+    if bool(config.get('use_serial_display')):
+        from display.controller import DisplayController
+        display_controller = DisplayController(context)
+        display_controller.splash()
+        timer.mark('first_frame')
+    # asyncio and the loop only after the first frame is on screen
+    from utils.runtime import Runtime
+    runtime = Runtime(context, config.get('timer_slack', 0.05))
+    governor = None
+    dispatch = runtime.dispatch
+    if bool(config.get('power_governor', True)):
+        from power.governor import PowerGovernor
+        governor = PowerGovernor(context, runtime.scheduler, display=display_controller)
+        dispatch = lambda callback: runtime.dispatch(governor.wrap(callback))
+    from utils.redis_utils import db_connect
+    context.redis_db = db_connect(config.get('redis_host', 'localhost'), 0, config.get('redis_unix_socket'))
+    context.redis_db.flushdb()
+    timer.mark('redis')
+    from gpiozero import Button
     button = Button(21, hold_time=5)
     button.when_held = shutdown
-    display_controller = DisplayController(context, button_up, button_down, button_left, button_right)
-    signal.signal(signal.SIGTERM, lambda sig, frame: signal_handler(sig, frame, context))
-    signal.signal(signal.SIGINT, lambda sig, frame: signal_handler(sig, frame, context))
-    if bool(config.get('use_ups_hat')): threading_function(ups_hat, args=(context,))
-    if bool(config.get('use_serial_display')): threading_function(display_controller.serial_displays)
-    if bool(config.get('auto_lldp_read')): threading_function(lldp_worker, args=(context,))
+    if display_controller is not None:
+        display_controller.bind_buttons(Button(6), Button(19), Button(5), Button(26), Button(20), Button(13),
+                                        dispatch=dispatch)
+    timer.mark('buttons')
+    profiler = SamplingProfiler(path=config.get('profile_file', '/tmp/rpint-profile.txt'))
+    runtime.loop.add_signal_handler(signal.SIGUSR1, profiler.toggle)
+    periods = task_periods(config)
+    if bool(config.get('metrics', True)):
+        runtime.every('metrics', periods['metrics'], lambda: export_metrics(context), blocking=True)
+    ups_monitor = None
+    if bool(config.get('use_ups_hat')):
+        from power.ups_hat import UPSMonitor
+        ups_monitor = UPSMonitor(context)
+        runtime.every('ups', periods['ups'], ups_monitor.step, blocking=True)
+    if display_controller is not None and display_controller.start():
+        runtime.every('display', periods['display'], display_controller.step, blocking=True)
+        display_controller.on_redraw = lambda delay: runtime.scheduler.wake('display', delay)
+    tracker = neighbor_tracker(context)
+    survey = None
+    if bool(config.get('survey')):
+        from lldp.survey import SurveyStore, battery_state
+        survey = SurveyStore(config.get('survey_path', '/var/lib/rpint/survey.db'),
+                             config.get('survey_batch_size', 50), config.get('survey_flush_interval', 30))
+        tracker.on_fresh.append(lambda neighbors: survey.record(neighbors, battery_state(context.redis_db)))
+        runtime.every('survey', periods['survey'], survey.flush, blocking=True)
+    if bool(config.get('auto_lldp_read')):
+        if config.get('lldp_read_mode') != 'link':
+            from utils.netlink import carrier
+            if carrier(config.get('lldp_interface', 'eth0')):
+                tracker.warm(config.get('lldp_interface', 'eth0'))
+            threading_function(link_watcher, args=(context, tracker))
+        runtime.every('neighbor_expiry', 1, tracker.expire, blocking=True)
+        # capture and link block on their own sockets and keep a thread each
+        if config.get('lldp_read_mode', 'watch') == 'watch':
+            runtime.spawn(lldp_watch_task, context, tracker, runtime)
+        elif config.get('lldp_read_mode') == 'capture':
+            threading_function(lldp_capture_worker, args=(context, tracker, runtime))
+        elif config.get('lldp_read_mode') == 'link':
+            threading_function(lldp_link_worker, args=(context, tracker))
+        else:
+            runtime.every('lldp', periods['lldp'], lldp_poller(tracker, runtime))
     else:
-        button.when_pressed = lambda: lldp()
-    pause()
+        button.when_pressed = runtime.dispatch(lldp_poller(tracker, runtime))
+    if bool(config.get('http_api')):
+        from api.server import StateHub, ApiServer
+        hub = StateHub(context.redis_db, config.get('http_api_push_interval', 1))
+        api = ApiServer(hub, config.get('http_api_host', '0.0.0.0'), config.get('http_api_port', 8080),
+                        config.get('http_api_max_clients', 32))
+        runtime.spawn(api.serve)
+    if config.get('linktest_peer'):
+        from linktest.tester import LinkTester
+        link_tester = LinkTester(context)
+        # KEY3; the test blocks for several seconds, so it runs on its own thread
+        Button(16).when_pressed = dispatch(lambda: threading_function(link_tester.run, name='Thread-linktest'))
+    if bool(config.get('linktest_reflector')):
+        from linktest.reflector import Reflector
+        threading_function(Reflector(port=config.get('linktest_port', 5201)).serve, args=(context.stop_event,),
+                           name='Thread-linktest-reflector')
+    if governor is not None:
+        governor.monitor = ups_monitor
+        runtime.every('governor', periods['governor'], governor.step, blocking=True)
+    runtime.loop.add_signal_handler(signal.SIGHUP, lambda: reload_config(CONFIG_PATH, context, runtime,
+                                                                          display_controller, governor))
+    timer.mark('workers')
+    timer.report(context.redis_db)
+    runtime.run()
+    if survey is not None:
+        survey.close()
+    journal.send("RPiNT stopped")
 
 if __name__ == '__main__':
     try:
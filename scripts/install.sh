@@ -101,8 +101,12 @@ add_sysctl_param "vm.overcommit_memory" "1" "/etc/sysctl.conf"
 add_sysctl_param "net.core.somaxconn" "512" "/etc/sysctl.conf"
 
 grep -q "^maxmemory" /etc/redis/redis.conf || echo "maxmemory 100mb" | tee -a /etc/redis/redis.conf
+grep -q "^unixsocket " /etc/redis/redis.conf || echo "unixsocket /run/redis/redis-server.sock" | tee -a /etc/redis/redis.conf
+grep -q "^unixsocketperm" /etc/redis/redis.conf || echo "unixsocketperm 770" | tee -a /etc/redis/redis.conf
+usermod -a -G redis $SUDO_USER
 
-systemctl start redis-server.service
+# restart so the unixsocket setting above takes effect before rpint starts
+systemctl restart redis-server.service
 
 cat <<EOF | tee /lib/systemd/system/rpint.service
 [Unit]
@@ -115,9 +119,12 @@ Documentation=https://github.com/darton/rpint
 Type=simple
 User=$SUDO_USER
 Group=$SUDO_USER
+AmbientCapabilities=CAP_NET_RAW
+StateDirectory=rpint
 Environment="RPINT_CONFIG_PATH=$installdir/rpint.toml"
 Environment="RPINT_FONT_PATH=$installdir/fonts/FreePixel.ttf"
 ExecStart=/usr/bin/python3 $installdir/rpint.py
+ExecReload=/bin/kill -HUP \$MAINPID
 StandardInput=tty-force
 WorkingDirectory=$installdir
 
@@ -0,0 +1,138 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from api.server import ApiServer, StateHub
+from bench.fakes import FakeRedis
+from power.governor import PowerGovernor
+from utils.runtime import Scheduler
+
+def fake_redis():
+    redis_db = FakeRedis()
+    redis_db.hset('LLDP', mapping={'chassis_id': '00:1e:bd:4a:10:80', 'port_id': 'Gi1/0/14'})
+    redis_db.set('LLDP_version', 1)
+    redis_db.set('battery_power', 1.5)
+    return redis_db
+
+async def request(port, path, headers=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    lines = [f'GET {path} HTTP/1.1', 'Host: test'] + [f'{k}: {v}' for k, v in (headers or {}).items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+    await writer.drain()
+    return reader, writer
+
+async def get(port, path, headers=None):
+    reader, writer = await request(port, path, headers)
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    status, *fields = head.decode().split('\r\n')
+    return int(status.split()[1]), dict(f.lower().split(': ', 1) for f in fields), body
+
+async def next_event(reader):
+    event = {}
+    while True:
+        line = (await asyncio.wait_for(reader.readline(), 5)).decode().rstrip('\n')
+        if not line:
+            if event:
+                return event
+            continue
+        if not line.startswith(':'):
+            name, _, value = line.partition(': ')
+            event[name] = value
+
+def serve(redis_db, test):
+    async def main():
+        server = ApiServer(StateHub(redis_db, interval=0.05), host='127.0.0.1', port=0, keepalive=0.2)
+        await server.start()
+        hub = asyncio.ensure_future(server.hub.run())
+        try:
+            await test(server.port)
+        finally:
+            hub.cancel()
+            await server.close()
+    asyncio.run(main())
+
+def test_etag_and_not_modified():
+    redis_db = fake_redis()
+    async def test(port):
+        status, headers, body = await get(port, '/api/state')
+        assert status == 200
+        assert json.loads(body)['lldp']['port_id'] == 'Gi1/0/14'
+        etag = headers['etag']
+        status, headers, body = await get(port, '/api/state', {'If-None-Match': etag})
+        assert (status, headers['etag'], body) == (304, etag, b'')
+        # the LLDP part is unchanged by a battery update, so its ETag still matches
+        status, headers, _ = await get(port, '/api/lldp')
+        lldp_etag = headers['etag']
+        redis_db.set('battery_power', 2.5)
+        status, headers, _ = await get(port, '/api/state', {'If-None-Match': etag})
+        assert status == 200 and headers['etag'] != etag
+        status, _, _ = await get(port, '/api/lldp', {'If-None-Match': lldp_etag})
+        assert status == 304
+        # a governor report bumps power_version, which changes the state
+        etag = headers['etag']
+        pipe = redis_db.pipeline()
+        pipe.hset('power', mapping={'profile': 'battery', 'battery_s': 5, 'battery_W': 1.2})
+        pipe.incr('power_version')
+        pipe.execute()
+        status, headers, body = await get(port, '/api/state', {'If-None-Match': etag})
+        # cumulative seconds are left out of the snapshot
+        assert status == 200 and json.loads(body)['power'] == {'profile': 'battery', 'battery_W': '1.2'}
+    serve(redis_db, test)
+
+def test_governor_reports_only_announce_changes():
+    redis_db = FakeRedis()
+    clock = [0.0]
+    context = SimpleNamespace(config={}, redis_db=redis_db)
+    governor = PowerGovernor(context, Scheduler(), monitor=SimpleNamespace(telemetry=SimpleNamespace(
+        charge=80, charging=False, load=1.0)), clock=lambda: clock[0])
+    for _ in range(5):
+        clock[0] += 5
+        governor.step()
+    # the profile on the first report, its draw on the second, then nothing new at a steady 1.0 W
+    assert redis_db.get('power_version') == '2'
+    assert redis_db.hget('power', 'active_s') == '20'
+    governor.monitor.telemetry.load = 1.5
+    clock[0] += 5
+    governor.step()
+    assert redis_db.get('power_version') == '3'
+
+def test_event_stream_resumes_from_last_event_id():
+    redis_db = fake_redis()
+    async def test(port):
+        reader, writer = await request(port, '/api/events')
+        await reader.readuntil(b'\r\n\r\n')
+        event = await next_event(reader)
+        assert event['event'] == 'state'
+        first = event['id']
+        writer.close()
+        # reconnecting with the current ETag sends nothing until the state changes
+        reader, writer = await request(port, '/api/events', {'Last-Event-ID': first})
+        await reader.readuntil(b'\r\n\r\n')
+        with_id = [line async for line in lines_until_keepalive(reader)]
+        assert not any(line.startswith(b'id:') for line in with_id)
+        redis_db.set('LLDP_version', 2)
+        event = await next_event(reader)
+        assert event['id'] != first
+        writer.close()
+    serve(redis_db, test)
+
+async def lines_until_keepalive(reader):
+    while True:
+        line = await asyncio.wait_for(reader.readline(), 5)
+        if line.startswith(b': keepalive'):
+            return
+        yield line
+
+def test_redis_down_answers_503():
+    redis_db = fake_redis()
+    def down():
+        raise ConnectionError('redis is down')
+    redis_db.pipeline = down
+    async def test(port):
+        status, _, _ = await get(port, '/api/lldp')
+        assert status == 503
+        status, _, _ = await get(port, '/api/events')
+        assert status == 503
+    serve(redis_db, test)
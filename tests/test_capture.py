@@ -0,0 +1,32 @@
+import json
+import os
+
+import pytest
+
+from bench.fakes import FIXTURES_DIR, load_fixture
+from lldp.capture import decode_frame, read_pcap
+from lldp.lldp import parse_neighbors
+
+def captured(name):
+    return [decode_frame(frame, 'eth0') for frame in read_pcap(os.path.join(FIXTURES_DIR, f'{name}.pcap'))]
+
+@pytest.mark.parametrize('name', ['cisco_c2960x', 'aruba_2930f_med'])
+def test_decode_matches_lldpcli(name):
+    (expected,) = parse_neighbors(json.loads(load_fixture(name)))
+    neighbor, ttl = captured(name)[0]
+    assert ttl == 120
+    assert set(neighbor) == set(expected)
+    for key, value in expected.items():
+        if key == 'auto_neg_current':
+            # lldpcli appends the MAU description: '1000BaseTFD - Four-pair Category 5 UTP, ...'
+            assert value.startswith(neighbor[key] + ' - ')
+        elif key == 'available_modes_str' and '/' not in value:
+            # lldpcli prints a lone advertised mode as a plain string without duplex flags
+            assert neighbor[key].startswith(value + '/')
+        else:
+            assert neighbor[key] == value, key
+
+def test_shutdown_lldpdu():
+    neighbor, ttl = captured('cisco_c2960x')[1]
+    assert ttl == 0
+    assert neighbor['chassis_id'] == '00:1e:bd:4a:10:80'
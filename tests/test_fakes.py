@@ -0,0 +1,33 @@
+import ast
+import os
+
+from bench.fakes import FakeRedis
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# CachedRedis needs keyspace notifications from a real server; the benches run without it
+SERVER_ONLY = {'config_get', 'config_set', 'pubsub'}
+
+def redis_commands():
+    """Every method RPiNT calls on a redis client or pipeline, by file."""
+    commands = {}
+    for directory, dirs, files in os.walk(ROOT):
+        dirs[:] = [d for d in dirs if d not in ('tests', 'bench', '.git', '__pycache__')]
+        for name in files:
+            if not name.endswith('.py'):
+                continue
+            path = os.path.join(directory, name)
+            with open(path) as file:
+                tree = ast.parse(file.read(), path)
+            for node in ast.walk(tree):
+                if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+                    continue
+                target = node.func.value
+                target = target.attr if isinstance(target, ast.Attribute) else getattr(target, 'id', None)
+                if target in ('redis_db', 'pipe') and node.func.attr != 'execute':
+                    commands.setdefault(node.func.attr, set()).add(os.path.relpath(path, ROOT))
+    return commands
+
+def test_fake_redis_covers_every_command():
+    missing = {command: files for command, files in redis_commands().items()
+               if command not in SERVER_ONLY and not hasattr(FakeRedis, command)}
+    assert not missing
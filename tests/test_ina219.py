@@ -0,0 +1,34 @@
+from power.INA219 import INA219
+from power.fake_smbus import FakeSMBus
+
+def ina219():
+    # bus 4.0 V, shunt 1.00 mV, current 100 mA, power 0.4 W
+    bus = FakeSMBus({0x02: 1000 << 3, 0x01: 100, 0x04: 100, 0x03: 200})
+    chip = INA219(bus=bus)
+    bus.reads = bus.writes = 0
+    return bus, chip
+
+def test_triggered_sample_is_one_write_and_four_reads():
+    bus, chip = ina219()
+    sleeps = []
+    sample = chip.sample(triggered=True, sleep=sleeps.append)
+    assert (bus.writes, bus.reads) == (1, 4)
+    assert sleeps == [chip.conversion_time()]
+    assert round(sample.bus_voltage_V, 3) == 4.0 and sample.current_mA == 100
+    bus.reads = bus.writes = 0
+    chip.sample()
+    assert (bus.writes, bus.reads) == (0, 4)
+
+def test_calibration_is_rewritten_only_once_lost():
+    bus, chip = ina219()
+    # a brown-out resets the chip: calibration gone, current and power read as zero
+    bus.registers.update({0x05: 0, 0x04: 0, 0x03: 0})
+    sample = chip.sample(triggered=True, sleep=lambda _: None)
+    assert (bus.writes, bus.reads) == (2, 4)
+    assert bus.registers[0x05] == 4096
+    # derived from the shunt voltage while the chip recalibrates
+    assert sample.current_mA == 100 and round(sample.power_W, 3) == 0.04
+    bus.registers.update({0x04: 100, 0x03: 200})
+    bus.reads = bus.writes = 0
+    chip.sample(triggered=True, sleep=lambda _: None)
+    assert (bus.writes, bus.reads) == (1, 4)
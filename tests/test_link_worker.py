@@ -0,0 +1,87 @@
+import threading
+from types import SimpleNamespace
+
+import lldp.lldp
+import rpint
+from bench.fakes import FakeRedis
+from utils.netlink import FakeLinkSource
+
+NEIGHBOR = {'interface': 'eth0', 'chassis_id': '00:11:22:33:44:55', 'port_id': 'Gi1/0/1'}
+
+class Tracker:
+    def __init__(self):
+        self.updates = []
+        self.warmed = 0
+        self.cleared = 0
+
+    def warm(self, interface):
+        self.warmed += 1
+
+    def clear(self, interface):
+        self.cleared += 1
+
+    def update_neighbors(self, neighbors):
+        self.updates.append(neighbors)
+
+def start_worker(monkeypatch, neighbors):
+    source = FakeLinkSource(False)
+    reads = []
+    def lldp_neighbors():
+        reads.append(source.now)
+        return list(neighbors)
+    monkeypatch.setattr(lldp.lldp, 'lldp_neighbors', lldp_neighbors)
+    context = SimpleNamespace(
+        config={'lldp_fast_interval': 0.125, 'lldp_fast_timeout': 0.5, 'lldp_slow_interval': 30},
+        redis_db=FakeRedis(),
+        stop_event=threading.Event(),
+    )
+    tracker = Tracker()
+    thread = threading.Thread(target=rpint.lldp_link_worker, args=(context, tracker, source, source.clock))
+    thread.start()
+    return context, tracker, source, thread, reads
+
+def stop_worker(context, source, thread):
+    context.stop_event.set()
+    source.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+
+def test_unrelated_events_do_not_read_lldp(monkeypatch):
+    context, tracker, source, thread, reads = start_worker(monkeypatch, [NEIGHBOR])
+    try:
+        for _ in range(20):
+            source.unrelated()
+        assert reads == []
+        source.set_carrier(True)
+        assert reads == [0]
+        assert tracker.warmed == 1
+        assert context.redis_db.get('link_state') == 'up'
+        # a neighbor was found, so the next read waits for lldp_slow_interval
+        for _ in range(20):
+            source.unrelated()
+            source.set_carrier(True)
+        source.advance(29)
+        assert reads == [0]
+        source.advance(1)
+        assert reads == [0, 30]
+    finally:
+        stop_worker(context, source, thread)
+
+def test_fast_reads_until_timeout_then_down(monkeypatch):
+    context, tracker, source, thread, reads = start_worker(monkeypatch, [])
+    try:
+        source.set_carrier(True)
+        for _ in range(50):
+            source.unrelated()
+        assert reads == [0]
+        # every lldp_fast_interval during lldp_fast_timeout, not once per netlink message
+        source.advance(2)
+        assert reads == [0, 0.125, 0.25, 0.375, 0.5]
+        cleared = tracker.cleared
+        source.set_carrier(False)
+        assert tracker.cleared == cleared + 1
+        assert context.redis_db.get('link_state') == 'down'
+        source.advance(60)
+        assert len(reads) == 5
+    finally:
+        stop_worker(context, source, thread)
@@ -0,0 +1,46 @@
+import threading
+from types import SimpleNamespace
+
+import linktest.tester
+from bench.fakes import FakeRedis
+from linktest.reflector import Reflector
+from linktest.tester import LinkTester, advertised_speed
+
+def make_tester(peer, **config):
+    return LinkTester(SimpleNamespace(config=dict(config, linktest_peer=peer), redis_db=FakeRedis()))
+
+def test_no_peer_does_nothing():
+    link_tester = make_tester('')
+    assert link_tester.run() is False
+    assert link_tester.context.redis_db.hgetall('linktest') == {}
+
+def test_unexpected_error_records_failed(monkeypatch):
+    def broken(*args):
+        raise ValueError('bad reply')
+    monkeypatch.setattr(linktest.tester, 'run_test', broken)
+    link_tester = make_tester('192.0.2.10')
+    assert link_tester.run() is True
+    result = link_tester.context.redis_db.hgetall('linktest')
+    assert result == {'status': 'failed', 'peer': '192.0.2.10', 'error': 'bad reply'}
+
+def test_local_reflector():
+    stop_event = threading.Event()
+    reflector = Reflector('127.0.0.1', 0)
+    threading.Thread(target=reflector.serve, args=(stop_event,), daemon=True).start()
+    try:
+        link_tester = make_tester('127.0.0.1', linktest_port=reflector.port, linktest_seconds=0.2,
+                             linktest_udp_rate=10e6)
+        assert link_tester.run() is True
+    finally:
+        stop_event.set()
+    result = link_tester.context.redis_db.hgetall('linktest')
+    assert result['status'] == 'done'
+    assert float(result['tcp_up_mbps']) > 0 and float(result['tcp_down_mbps']) > 0
+    assert result['loss_pct'] == '0.0'
+
+def test_advertised_speed_from_lldpcli():
+    assert advertised_speed('1000BaseTFD - Four-pair Category 5 UTP, full duplex mode') == (1000, 'full')
+    assert advertised_speed('100BaseTXHD - 2 pair category 5 UTP, half duplex mode') == (100, 'half')
+    assert advertised_speed('1000BaseTFD') == (1000, 'full')
+    assert advertised_speed('10GigBaseSR') == (None, None)
+    assert advertised_speed('N/A') == (None, None)
@@ -0,0 +1,39 @@
+import json
+import os
+
+from bench.fakes import FIXTURES_DIR
+from lldp.lldp import _apply_watch_events, _decode_watch_line
+
+class CountingDecoder(json.JSONDecoder):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def raw_decode(self, s, idx=0):
+        self.calls += 1
+        return super().raw_decode(s, idx)
+
+def watch_output():
+    with open(os.path.join(FIXTURES_DIR, 'cisco_c2960x.json')) as file:
+        body = json.load(file)['lldp']
+    # lldpcli watch -f json: indented events, then a compact one
+    text = json.dumps({'lldp-added': body}, indent=2) + '\n' + json.dumps({'lldp-deleted': body}) + '\n'
+    return text.splitlines(keepends=True)
+
+def test_events_are_decoded_once_they_close():
+    decoder, parts, neighbors = CountingDecoder(), [], {}
+    lines = watch_output()
+    events = [_decode_watch_line(decoder, parts, line) for line in lines]
+    # one decode per event, on the line that closes it
+    assert decoder.calls == 2
+    assert [i for i, found in enumerate(events) if found] == [len(lines) - 2, len(lines) - 1]
+    _apply_watch_events(neighbors, events[-2])
+    assert [n['port_id'] for n in neighbors.values()] == ['Gi1/0/14']
+    _apply_watch_events(neighbors, events[-1])
+    assert neighbors == {} and parts == []
+
+def test_a_split_compact_event_waits_for_its_end():
+    decoder, parts = CountingDecoder(), []
+    assert _decode_watch_line(decoder, parts, '{"lldp-updated": {}, "x": "}"\n') == []
+    assert _decode_watch_line(decoder, parts, '}\n') == [{'lldp-updated': {}, 'x': '}'}]
+    assert parts == []
@@ -0,0 +1,23 @@
+import threading
+
+from utils.metrics import Metrics
+
+def test_updates_from_many_threads_are_not_lost():
+    metrics = Metrics()
+    def work(n):
+        for i in range(2000):
+            metrics.observe(f'stage_{i % 7}', 0.001)
+            metrics.count('frames')
+        metrics.thread_state(f'worker{n}', False)
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    # exporting while the workers write must neither raise nor tear a histogram
+    while any(thread.is_alive() for thread in threads):
+        metrics.prometheus()
+    for thread in threads:
+        thread.join()
+    summary = metrics.summary()
+    assert summary['frames'] == 8000
+    assert sum(summary[f'stage_{i}_count'] for i in range(7)) == 8000
+    assert [k for k in summary if k.startswith('thread_')] == [f'thread_worker{n}' for n in range(4)]
@@ -0,0 +1,120 @@
+import os
+import socket
+import threading
+from queue import SimpleQueue
+
+from bench.fakes import FIXTURES_DIR, FakeRedis
+from lldp.capture import lldp_capture, read_pcap
+from lldp.lldp import LLDPChangeTracker, NEIGHBORS_KEY
+from lldp.neighbor_cache import NeighborCache, WarmNeighbors
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def neighbor(interface, chassis='00:1e:bd:4a:10:80', port='Gi1/0/14'):
+    return {'interface': interface, 'chassis_id': chassis, 'port_id': port}
+
+def shown(redis_db):
+    return {key: redis_db.hget(key, 'stale') for key in redis_db.smembers(NEIGHBORS_KEY)}
+
+def warm_neighbors(tmp_path, clock):
+    redis_db = FakeRedis()
+    cache = NeighborCache(str(tmp_path / 'neighbors.jsonl'))
+    return redis_db, WarmNeighbors(LLDPChangeTracker(redis_db), cache, hold=35, clock=clock)
+
+def test_link_events_only_touch_their_interface(tmp_path):
+    clock = Clock()
+    redis_db, warm = warm_neighbors(tmp_path, clock)
+    warm.update_neighbors([neighbor('eth0'), neighbor('eth1', port='Gi1/0/2')])
+    assert len(shown(redis_db)) == 2
+    warm.clear('eth0')
+    assert list(shown(redis_db)) == ['LLDP:eth1:00:1e:bd:4a:10:80:Gi1/0/2']
+    warm.warm('eth0')
+    assert shown(redis_db) == {'LLDP:eth0:00:1e:bd:4a:10:80:Gi1/0/14': '1',
+                               'LLDP:eth1:00:1e:bd:4a:10:80:Gi1/0/2': '0'}
+    # a read with nothing on eth0 yet keeps the stale neighbor during the hold
+    warm.update_neighbors([neighbor('eth1', port='Gi1/0/2')])
+    assert len(shown(redis_db)) == 2
+    clock.now += 36
+    assert warm.expire()
+    assert list(shown(redis_db)) == ['LLDP:eth1:00:1e:bd:4a:10:80:Gi1/0/2']
+
+def test_primary_hash_follows_the_configured_interface():
+    redis_db = FakeRedis()
+    LLDPChangeTracker(redis_db, 'eth1').update_neighbors([neighbor('eth0'), neighbor('eth1', port='Gi1/0/2')])
+    assert redis_db.hget('LLDP', 'port_id') == 'Gi1/0/2'
+
+class ScriptedSocket:
+    """recvfrom() runs one step of the script per call, in the capture thread."""
+    def __init__(self, steps, stop_event):
+        self.steps = iter(steps)
+        self.stop_event = stop_event
+
+    def settimeout(self, timeout):
+        pass
+
+    def close(self):
+        pass
+
+    def recvfrom(self, size):
+        step = next(self.steps, None)
+        if step is None:
+            self.stop_event.set()
+            raise socket.timeout()
+        result = step()
+        if not isinstance(result, tuple):
+            raise socket.timeout()
+        return result
+
+def test_replug_in_capture_mode_shows_the_same_lldpdu_again(tmp_path):
+    clock = Clock()
+    redis_db, warm = warm_neighbors(tmp_path, clock)
+    resets = SimpleQueue()
+    warm.on_link.append(resets.put)
+    frame = next(read_pcap(os.path.join(FIXTURES_DIR, 'cisco_c2960x.pcap')))
+    key = 'LLDP:eth0:00:1e:bd:4a:10:80:Gi1/0/14'
+    seen = []
+    def check(expected):
+        def step():
+            seen.append(shown(redis_db))
+            assert shown(redis_db) == expected
+        return step
+    def expire():
+        clock.now += 36
+        warm.expire()
+    stop_event = threading.Event()
+    steps = [
+        lambda: (frame, ('eth0',)),
+        check({key: '0'}),
+        lambda: warm.clear('eth0'),
+        check({}),
+        lambda: warm.warm('eth0'),
+        check({key: '1'}),
+        lambda: (frame, ('eth0',)),
+        check({key: '0'}),
+        expire,
+        check({key: '0'}),
+    ]
+    assert lldp_capture(warm.update_neighbors, stop_event, ('eth0',), ScriptedSocket(steps, stop_event),
+                        clock=clock, resets=resets)
+    assert len(seen) == 5
+
+def test_concurrent_updates_leave_redis_consistent(tmp_path):
+    clock = Clock()
+    redis_db, warm = warm_neighbors(tmp_path, clock)
+    lists = [[neighbor('eth0', port=f'Gi1/0/{i}')] for i in range(4)]
+    def hammer(neighbors):
+        for _ in range(200):
+            warm.update_neighbors(neighbors)
+    threads = [threading.Thread(target=hammer, args=(n,)) for n in lists]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    warm.update_neighbors(lists[0])
+    assert set(shown(redis_db)) == {'LLDP:eth0:00:1e:bd:4a:10:80:Gi1/0/0'}
+    assert {k for k in redis_db.data if k.startswith('LLDP:eth0')} == {'LLDP:eth0:00:1e:bd:4a:10:80:Gi1/0/0'}
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import time
+
+from utils.runtime import Scheduler
+
+def run_for(scheduler, seconds):
+    async def main():
+        asyncio.get_running_loop().call_later(seconds, scheduler.stop)
+        await scheduler.run()
+    asyncio.run(main())
+
+def test_blocking_tasks_run_off_the_loop():
+    scheduler = Scheduler()
+    threads = set()
+    ticks = []
+    def slow():
+        threads.add(threading.current_thread().name)
+        time.sleep(0.2)
+    def tick():
+        ticks.append(time.monotonic())
+    scheduler.every('slow', 0.05, slow, blocking=True)
+    scheduler.every('tick', 0.02, tick)
+    run_for(scheduler, 0.5)
+    assert threads and all(name.startswith('Thread-blocking') for name in threads)
+    # the inline task kept its period while the blocking one slept
+    assert len(ticks) >= 15
+    assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.1
+
+def test_wake_from_the_worker_thread():
+    scheduler = Scheduler()
+    runs = []
+    def first():
+        runs.append('first')
+        scheduler.wake('second')
+    scheduler.every('first', 0.1, first, blocking=True)
+    scheduler.every('second', 60, lambda: runs.append('second'), delay=60)
+    run_for(scheduler, 0.05)
+    assert runs == ['first', 'second']
+
+def test_wake_with_delay():
+    scheduler = Scheduler(slack=0.01)
+    runs = []
+    start = time.monotonic()
+    def animate():
+        runs.append(time.monotonic() - start)
+        if len(runs) < 4:
+            scheduler.wake('animate', 0.05)
+    scheduler.every('animate', 60, animate)
+    run_for(scheduler, 0.3)
+    assert len(runs) == 4
+    # paced by the delay, not back to back
+    assert all(b - a >= 0.04 for a, b in zip(runs, runs[1:]))
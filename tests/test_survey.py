@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from bench.fakes import FakeRedis
+from lldp.survey import COLUMNS, SurveyStore, battery_state, export_csv, export_json
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def neighbor(port, vlan='10'):
+    return {'interface': 'eth0', 'chassis_id': '00:1e:bd:4a:10:80', 'port_id': port, 'vlan_id': vlan, 'stale': '0'}
+
+def count(store):
+    return store.db.execute('SELECT COUNT(*) FROM readings').fetchone()[0]
+
+def test_readings_are_batched_and_flushed_on_close(tmp_path):
+    clock = Clock()
+    path = str(tmp_path / 'survey.db')
+    store = SurveyStore(path, batch_size=3, flush_interval=30, clock=clock)
+    store.record([neighbor('Gi1/0/1'), neighbor('Gi1/0/2')])
+    # a repeat of the last reading for a port is dropped
+    store.record([neighbor('Gi1/0/1')])
+    assert (count(store), len(store.pending)) == (0, 2)
+    store.record([neighbor('Gi1/0/3')])
+    assert (count(store), len(store.pending)) == (3, 0)
+    store.record([neighbor('Gi1/0/1', vlan='20')])
+    assert count(store) == 3
+    clock.now += 30
+    store.record([neighbor('Gi1/0/4')])
+    assert count(store) == 5
+    store.record([neighbor('Gi1/0/5')])
+    store.close()
+    assert count(SurveyStore(path)) == 6
+
+def test_export_with_filters_and_battery(tmp_path):
+    redis_db = FakeRedis()
+    redis_db.set('battery_power', 80)
+    redis_db.set('battery_voltage', 4.05)
+    redis_db.set('battery_charging', 0)
+    store = SurveyStore(str(tmp_path / 'survey.db'))
+    store.record([neighbor('Gi1/0/1'), neighbor('Gi1/0/2', vlan='20')], battery_state(redis_db), timestamp=1e9)
+    store.flush()
+    file = io.StringIO()
+    export_csv(store.query(vlan_id='20'), file)
+    rows = list(csv.DictReader(io.StringIO(file.getvalue())))
+    assert list(rows[0]) == COLUMNS
+    assert [(r['port_id'], r['battery_power'], r['battery_charging']) for r in rows] == [('Gi1/0/2', '80.0', '0')]
+    file = io.StringIO()
+    export_json(store.query(limit=1), file)
+    assert [r['port_id'] for r in json.loads(file.getvalue())] == ['Gi1/0/1']
+    store.close()
+
+class CountingCursor:
+    def __init__(self, cursor, fetches):
+        self.cursor = cursor
+        self.fetches = fetches
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __setattr__(self, name, value):
+        if name == 'arraysize':
+            self.cursor.arraysize = value
+        else:
+            super().__setattr__(name, value)
+
+    def fetchmany(self):
+        rows = self.cursor.fetchmany()
+        self.fetches.append(len(rows))
+        return rows
+
+def test_export_reads_in_chunks(tmp_path):
+    store = SurveyStore(str(tmp_path / 'survey.db'), batch_size=10000)
+    store.record([neighbor(f'Gi1/0/{i}') for i in range(1200)])
+    store.flush()
+    db, fetches = store.db, []
+    store.db = type('DB', (), {'cursor': lambda self: CountingCursor(db.cursor(), fetches)})()
+    readings = store.query()
+    assert len(list(islice(readings, 10))) == 10
+    # only the first chunk is in memory
+    assert fetches == [500]
+    assert sum(1 for _ in readings) == 1190
+    assert fetches == [500, 500, 200, 0]
+    db.close()
@@ -2,11 +2,13 @@ import tomllib
 import sys
 from systemd import journal
 
+def config_read(path_to_config):
+    with open(path_to_config, "rb") as file:
+        return tomllib.load(file)
+
 def config_load(path_to_config):
     try:
-        with open(path_to_config, "rb") as file:
-            config_toml = tomllib.load(file)
-        return config_toml
+        return config_read(path_to_config)
     except FileNotFoundError:
         error = f"Can't load RPiNT config file: {path_to_config}"
         journal.send(error)
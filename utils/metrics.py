@@ -0,0 +1,211 @@
+import os
+import sys
+import threading
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter, sleep
+from systemd import journal
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Histogram:
+    """Fixed-bucket latency histogram (seconds), Prometheus style."""
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def copy(self):
+        histogram = Histogram()
+        histogram.counts = list(self.counts)
+        histogram.count, histogram.sum, histogram.max = self.count, self.sum, self.max
+        return histogram
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+class LoopTimer:
+    """Times one worker loop iteration and counts overruns of its period."""
+    def __init__(self, metrics, name, period=None):
+        self.metrics = metrics
+        self.name = name
+        self.period = period
+        self._start = None
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self._start
+        self.metrics.observe(f'loop_{self.name}', elapsed)
+        if self.period is not None and elapsed > self.period:
+            self.metrics.count(f'overrun_{self.name}')
+        return False
+
+class Metrics:
+    """Always-on hot-path timings, shared by all worker threads.
+
+    Updates and snapshot() take one lock; exports and the debug page
+    format a snapshot, never the live histograms.
+    """
+    def __init__(self):
+        self.histograms = {}
+        self.counters = Counter()
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def thread_state(self, name, alive):
+        with self.lock:
+            self.threads[name] = alive
+
+    def snapshot(self):
+        """Copies of the histograms, counters and thread states, sorted by name."""
+        with self.lock:
+            return (sorted((name, h.copy()) for name, h in self.histograms.items()),
+                    sorted(self.counters.items()), sorted(self.threads.items()))
+
+    @contextmanager
+    def stage(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f'stage_{name}', perf_counter() - start)
+
+    def loop(self, name, period=None):
+        return LoopTimer(self, name, period)
+
+    def rss_bytes(self):
+        try:
+            with open('/proc/self/statm') as file:
+                return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            return 0
+
+    def summary(self):
+        histograms, counters, threads = self.snapshot()
+        data = {'rss_bytes': self.rss_bytes()}
+        for name, histogram in histograms:
+            data[f'{name}_count'] = histogram.count
+            data[f'{name}_p50_ms'] = round(histogram.quantile(0.5) * 1000, 2)
+            data[f'{name}_p95_ms'] = round(histogram.quantile(0.95) * 1000, 2)
+            data[f'{name}_max_ms'] = round(histogram.max * 1000, 2)
+        for name, value in counters:
+            data[name] = value
+        for name, alive in threads:
+            data[f'thread_{name}'] = int(alive)
+        return data
+
+    def prometheus(self):
+        histograms, counters, threads = self.snapshot()
+        lines = ['# TYPE rpint_rss_bytes gauge', f'rpint_rss_bytes {self.rss_bytes()}']
+        for name, histogram in histograms:
+            metric = f'rpint_{name}_seconds'
+            lines.append(f'# TYPE {metric} histogram')
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f'{metric}_sum {histogram.sum:.6f}')
+            lines.append(f'{metric}_count {histogram.count}')
+        for name, value in counters:
+            lines.append(f'# TYPE rpint_{name}_total counter')
+            lines.append(f'rpint_{name}_total {value}')
+        for name, alive in threads:
+            lines.append(f'rpint_thread_up{{thread="{name}"}} {int(alive)}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, redis_db=None, path=None):
+        if redis_db is not None:
+            redis_db.hset('metrics', mapping=self.summary())
+        if path:
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w') as file:
+                file.write(self.prometheus())
+            os.replace(tmp_path, path)
+
+metrics = Metrics()
+
+def export_metrics(context):
+    try:
+        metrics.export(context.redis_db, context.config.get('metrics_file', '/tmp/rpint.prom'))
+    except OSError as e:
+        journal.send(f"Metrics export failed: {e}")
+
+class SamplingProfiler:
+    """Samples every thread's stack at a fixed rate while running.
+
+    Stacks are kept as collapsed "frame;frame;frame" counts, the input
+    format of flamegraph.pl, and written out when the profiler stops.
+    """
+    def __init__(self, interval=0.01, path='/tmp/rpint-profile.txt'):
+        self.interval = interval
+        self.path = path
+        self.stacks = Counter()
+        self.running = threading.Event()
+        self.thread = None
+
+    def toggle(self):
+        if self.running.is_set():
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        self.stacks.clear()
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, name="Thread-profiler", daemon=True)
+        self.thread.start()
+        journal.send("Sampling profiler started")
+
+    def stop(self):
+        self.running.clear()
+        self.thread.join()
+        with open(self.path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+        journal.send(f"Sampling profiler stopped, {sum(self.stacks.values())} samples written to {self.path}")
+
+    def _run(self):
+        own = threading.get_ident()
+        while self.running.is_set():
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            sleep(self.interval)
@@ -0,0 +1,155 @@
+import select
+import socket
+import struct
+import threading
+from collections import deque
+from time import monotonic
+
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+
+def carrier(interface):
+    try:
+        with open(f'/sys/class/net/{interface}/carrier') as file:
+            return file.read().strip() == '1'
+    except OSError:
+        return False
+
+class NetlinkLinkSource:
+    """Carrier up/down notifications for one interface from rtnetlink."""
+    def __init__(self, interface):
+        self.interface = interface
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self.sock.bind((0, RTMGRP_LINK))
+        self.index = self._index()
+        self.state = self.carrier()
+
+    def carrier(self):
+        return carrier(self.interface)
+
+    def wait(self, timeout=None):
+        """Return the new carrier state once it changes, or None on timeout.
+
+        Messages for other interfaces, or that leave the carrier as it was,
+        are read and ignored without returning early.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - monotonic())
+            readable, _, _ = select.select([self.sock], [], [], remaining)
+            if not readable:
+                return None
+            state = self._receive()
+            if state is not None:
+                return state
+            if deadline is not None and monotonic() >= deadline:
+                return None
+
+    def _receive(self):
+        data = self.sock.recv(65536)
+        if self.index is None:
+            self.index = self._index()
+        state = self.state
+        offset = 0
+        while offset + 16 <= len(data):
+            length, msg_type = struct.unpack_from('=IH', data, offset)
+            if length < 16:
+                break
+            if msg_type in (RTM_NEWLINK, RTM_DELLINK) and length >= 32:
+                _, _, index, flags, _ = struct.unpack_from('=BxHiII', data, offset + 16)
+                if index == self.index:
+                    state = msg_type == RTM_NEWLINK and flags & (IFF_UP | IFF_LOWER_UP) == IFF_UP | IFF_LOWER_UP
+            offset += (length + 3) & ~3
+        if state == self.state:
+            return None
+        self.state = state
+        return state
+
+    def _index(self):
+        try:
+            return socket.if_nametoindex(self.interface)
+        except OSError:
+            return None
+
+    def close(self):
+        self.sock.close()
+
+class FakeLinkSource:
+    """Drop-in for NetlinkLinkSource that the test steps on its own clock.
+
+    wait() parks the worker until the test calls set_carrier(), unrelated()
+    or advance(), and each of those returns once the worker is parked in
+    wait() again, so the test always observes it idle. Time is `now`
+    (read through clock()); it only moves when advance() lets a wait run
+    to its deadline, so the worker sees exactly the timeouts it asked for.
+    """
+    def __init__(self, carrier=False):
+        self.state = carrier
+        self.events = deque()
+        self.waits = 0
+        self.now = self.target = 0.0
+        self.parked = self.closed = False
+        self.cond = threading.Condition()
+
+    def clock(self):
+        return self.now
+
+    def carrier(self):
+        return self.state
+
+    def set_carrier(self, state):
+        self._step(state)
+
+    def unrelated(self):
+        """A netlink message that doesn't change the carrier, e.g. for another interface."""
+        self._step(None)
+
+    def advance(self, seconds):
+        with self.cond:
+            self.target += seconds
+        self._step()
+
+    def stop(self):
+        """Release the worker from wait() for good; it must see its stop_event next."""
+        with self.cond:
+            self.closed = True
+            self.parked = False
+            self.cond.notify_all()
+
+    def _step(self, *events):
+        with self.cond:
+            self._idle()
+            self.events.extend(events)
+            self.parked = False
+            self.cond.notify_all()
+            self._idle()
+
+    def _idle(self):
+        if not self.cond.wait_for(lambda: self.parked or self.closed, timeout=5):
+            raise RuntimeError("the worker didn't come back to wait()")
+
+    def wait(self, timeout=None):
+        with self.cond:
+            self.waits += 1
+            deadline = None if timeout is None else self.now + timeout
+            while not self.closed:
+                while self.events:
+                    state = self.events.popleft()
+                    if state is not None and state != self.state:
+                        self.state = state
+                        return state
+                if deadline is not None and deadline <= self.target:
+                    self.now = max(self.now, deadline)
+                    return None
+                self.now = self.target
+                self.parked = True
+                self.cond.notify_all()
+                self.cond.wait_for(lambda: not self.parked)
+            return None
+
+    def close(self):
+        self.stop()
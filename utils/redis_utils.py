@@ -1,13 +1,117 @@
+import os
 import redis
 import sys
+import threading
 from systemd import journal
 
-def db_connect(dbhost, dbnum):
+_MISSING = object()
+
+def db_connect(dbhost, dbnum, unix_socket_path=None, max_connections=8):
+    """Connect over the Unix socket if it exists, otherwise over TCP to dbhost."""
+    if unix_socket_path and not os.path.exists(unix_socket_path):
+        journal.send(f"Redis socket {unix_socket_path} not found, connecting to {dbhost} over TCP")
+        unix_socket_path = None
     try:
-        redis_db = redis.StrictRedis(host=dbhost, port=6379, db=str(dbnum), charset="utf-8", decode_responses=True)
+        if unix_socket_path:
+            pool = redis.ConnectionPool(connection_class=redis.UnixDomainSocketConnection, path=unix_socket_path,
+                                        db=dbnum, max_connections=max_connections,
+                                        encoding="utf-8", decode_responses=True)
+        else:
+            pool = redis.ConnectionPool(host=dbhost, port=6379, db=dbnum, max_connections=max_connections,
+                                        encoding="utf-8", decode_responses=True)
+        redis_db = redis.StrictRedis(connection_pool=pool)
         redis_db.ping()
         return redis_db
     except Exception as e:
+        if unix_socket_path:
+            journal.send(f"Can't connect to Redis socket {unix_socket_path} ({e}), trying {dbhost} over TCP")
+            return db_connect(dbhost, dbnum, None, max_connections)
         error = f"Can't connect to RedisDB host: {dbhost} ({e})"
         journal.send(error)
         sys.exit(error)
+
+class CachedRedis:
+    """Read-through client-side cache for get/hgetall/smembers.
+
+    Entries are invalidated from keyspace notifications, so unchanged keys
+    are served from memory without a round trip. If the notification
+    subscription breaks, the cache is dropped and reads go straight to
+    Redis until it is re-established.
+    """
+    def __init__(self, redis_db, db=0):
+        self.redis_db = redis_db
+        self.db = db
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        self.enabled = False
+        self.generation = 0
+        self.lock = threading.Lock()
+        try:
+            events = redis_db.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+            wanted = set(events) | set('K$hgsx')
+            if set(events) != wanted:
+                redis_db.config_set('notify-keyspace-events', ''.join(sorted(wanted)))
+        except redis.RedisError as e:
+            journal.send(f"Redis client cache disabled, keyspace notifications unavailable: {e}")
+            return
+        self.thread = threading.Thread(target=self._listen, name="Thread-redis-cache", daemon=True)
+        self.thread.start()
+
+    def _listen(self):
+        from time import sleep
+        prefix = f'__keyspace@{self.db}__:'
+        while True:
+            pubsub = self.redis_db.pubsub()
+            try:
+                pubsub.psubscribe(f'{prefix}*')
+                for message in pubsub.listen():
+                    if message['type'] == 'psubscribe':
+                        self._invalidate(None)
+                        self.enabled = True
+                    elif message['type'] == 'pmessage':
+                        self._invalidate(message['channel'][len(prefix):])
+            except redis.RedisError as e:
+                journal.send(f"Redis client cache invalidation lost: {e}")
+            finally:
+                self.enabled = False
+                self._invalidate(None)
+                pubsub.close()
+            sleep(1)
+
+    def _invalidate(self, key):
+        with self.lock:
+            self.generation += 1
+            if key is None:
+                self.cache.clear()
+            else:
+                for command in ('get', 'hgetall', 'smembers'):
+                    self.cache.pop((command, key), None)
+
+    def _read(self, command, key):
+        if not self.enabled:
+            return getattr(self.redis_db, command)(key)
+        with self.lock:
+            entry = self.cache.get((command, key), _MISSING)
+            generation = self.generation
+        if entry is not _MISSING:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        value = getattr(self.redis_db, command)(key)
+        with self.lock:
+            if self.enabled and generation == self.generation:
+                self.cache[(command, key)] = value
+        return value
+
+    def get(self, key):
+        return self._read('get', key)
+
+    def hgetall(self, key):
+        return self._read('hgetall', key)
+
+    def smembers(self, key):
+        return self._read('smembers', key)
+
+    def __getattr__(self, name):
+        return getattr(self.redis_db, name)
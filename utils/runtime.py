@@ -0,0 +1,213 @@
+import asyncio
+import inspect
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from systemd import journal
+from utils.metrics import metrics
+
+class PeriodicTask:
+    __slots__ = ('name', 'period', 'callback', 'due', 'task', 'paused', 'blocking')
+
+    def __init__(self, name, period, callback, due, blocking=False):
+        self.name = name
+        self.period = period
+        self.callback = callback
+        self.due = due
+        self.task = None
+        self.paused = False
+        self.blocking = blocking
+
+class Scheduler:
+    """Runs periodic tasks from one asyncio loop with a single timer.
+
+    Every task that falls due within `slack` seconds of the earliest one
+    runs in the same wakeup, so tasks with related periods share wakeups
+    instead of each sleeping on its own. Plain functions run inline;
+    coroutine functions get their own asyncio task and are skipped (and
+    counted as an overrun) while the previous run is still going.
+    Blocking functions (I2C, SPI, sync Redis, SQLite) are registered with
+    blocking=True and run the same way on one worker thread, so they
+    neither stall the loop nor run concurrently with each other.
+    set_period() and wake() may be called from that thread too.
+    """
+    def __init__(self, slack=0.05, clock=monotonic):
+        self.slack = slack
+        self.clock = clock
+        self.tasks = []
+        self.wakeups = 0
+        self.stopped = False
+        self._wake = None
+        self._loop = None
+        self._thread = None
+        self._executor = None
+
+    def every(self, name, period, callback, delay=0.0, blocking=False):
+        self.tasks.append(PeriodicTask(name, period, callback, self.clock() + delay, blocking))
+        self._notify()
+
+    def set_period(self, name, period):
+        """Change a task's period; None pauses it. Unknown names are ignored."""
+        for task in self.tasks:
+            if task.name != name:
+                continue
+            if period is None:
+                task.paused = True
+                continue
+            now = self.clock()
+            task.due = now if task.paused else min(task.due, now + period)
+            task.period = period
+            task.paused = False
+        self._notify()
+
+    def wake(self, name, delay=0.0):
+        """Run a task `delay` seconds from now if that is sooner than its next period."""
+        for task in self.tasks:
+            if task.name == name and not task.paused:
+                task.due = min(task.due, self.clock() + delay)
+        self._notify()
+
+    def stop(self):
+        self.stopped = True
+        self._notify()
+
+    def _notify(self):
+        if self._wake is None:
+            return
+        if threading.get_ident() == self._thread:
+            self._wake.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.get_ident()
+        try:
+            while not self.stopped:
+                now = self.clock()
+                due = min((t.due for t in self.tasks if not t.paused), default=None)
+                if due is None or due > now + self.slack:
+                    await self._sleep(None if due is None else due - now)
+                    continue
+                self.wakeups += 1
+                for task in self.tasks:
+                    if not task.paused and task.due <= now + self.slack:
+                        task.due = task.due + task.period if task.due + task.period > now else now + task.period
+                        self._run(task)
+                await asyncio.sleep(0)
+        finally:
+            running = [t.task for t in self.tasks if t.task is not None and not t.task.done()]
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+
+    async def _sleep(self, timeout):
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    def _run(self, task):
+        if task.blocking or inspect.iscoroutinefunction(task.callback):
+            if task.task is not None and not task.task.done():
+                metrics.count(f'overrun_{task.name}')
+                return
+            task.task = asyncio.create_task(self._run_async(task))
+            return
+        with metrics.loop(task.name, task.period):
+            try:
+                task.callback()
+            except Exception as e:
+                journal.send(f"Task '{task.name}' failed: {e}")
+
+    def run_blocking(self, callback, *args):
+        """Queue a blocking call on the worker thread; await the result on the loop."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix='Thread-blocking')
+        return asyncio.get_running_loop().run_in_executor(self._executor, callback, *args)
+
+    async def _run_async(self, task):
+        with metrics.loop(task.name, task.period):
+            try:
+                if task.blocking:
+                    await self.run_blocking(task.callback)
+                else:
+                    await task.callback()
+            except Exception as e:
+                journal.send(f"Task '{task.name}' failed: {e}")
+
+class Runtime:
+    """The single asyncio event loop RPiNT's workers run on.
+
+    Periodic work goes through the Scheduler, long-running coroutines
+    through spawn(), and callbacks from other threads (gpiozero buttons)
+    through dispatch(), which hands them over to the loop thread.
+    Coroutines await blocking(), which runs sync Redis or file work on
+    the scheduler's worker thread, in order with the blocking tasks.
+    SIGTERM and SIGINT stop the scheduler, cancel the background tasks
+    and return from run().
+    """
+    def __init__(self, context, slack=0.05):
+        self.context = context
+        self.loop = asyncio.new_event_loop()
+        self.scheduler = Scheduler(slack)
+        self.background = []
+        self._pending = set()
+
+    def every(self, name, period, callback, delay=0.0, blocking=False):
+        self.scheduler.every(name, period, callback, delay, blocking)
+
+    def blocking(self, callback, *args):
+        return self.scheduler.run_blocking(callback, *args)
+
+    def spawn(self, coroutine_function, *args):
+        self.background.append((coroutine_function, args))
+
+    def dispatch(self, callback):
+        def handler():
+            self.loop.call_soon_threadsafe(self._invoke, callback)
+        return handler
+
+    def _invoke(self, callback):
+        if inspect.iscoroutinefunction(callback):
+            task = self.loop.create_task(callback())
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+            task.add_done_callback(_report)
+            return
+        try:
+            callback()
+        except Exception as e:
+            journal.send(f"Callback '{getattr(callback, '__name__', callback)}' failed: {e}")
+
+    def stop(self):
+        self.context.stop_event.set()
+        self.scheduler.stop()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(sig, self.stop)
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+    async def _main(self):
+        tasks = [asyncio.create_task(function(*args), name=function.__name__) for function, args in self.background]
+        for task in tasks:
+            task.add_done_callback(_report)
+        await self.scheduler.run()
+        tasks.extend(self._pending)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _report(task):
+    if not task.cancelled() and task.exception() is not None:
+        journal.send(f"Task '{task.get_name()}' crashed: {task.exception()}")
@@ -0,0 +1,23 @@
+from time import monotonic
+from systemd import journal
+
+class StartupTimer:
+    """Collects per-phase startup times and reports them to the journal."""
+    def __init__(self, start=None):
+        self.start = monotonic() if start is None else start
+        self.last = self.start
+        self.phases = []
+
+    def mark(self, phase):
+        now = monotonic()
+        self.phases.append((phase, round((now - self.last) * 1000)))
+        self.last = now
+
+    def total_ms(self):
+        return round((self.last - self.start) * 1000)
+
+    def report(self, redis_db=None):
+        summary = ", ".join(f"{phase} {ms} ms" for phase, ms in self.phases)
+        journal.send(f"Startup: {summary}, total {self.total_ms()} ms")
+        if redis_db is not None:
+            redis_db.hset('startup', mapping={**dict(self.phases), 'total': self.total_ms()})
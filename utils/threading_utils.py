@@ -1,12 +1,13 @@
 import threading
 from systemd import journal
+from utils.metrics import metrics
 
 def threading_function(function_name: callable, args=(), kwargs=None, name=None):
     if kwargs is None:
         kwargs = {}
     try:
         thread_name = name or f"Thread-{function_name.__name__}"
-        t = threading.Thread(target=function_name, name=thread_name, args=args, kwargs=kwargs)
+        t = threading.Thread(target=_tracked, name=thread_name, args=(function_name, thread_name, args, kwargs))
         t.daemon = True
         t.start()
         journal.send(f"Thread '{thread_name}' started successfully.")
@@ -14,3 +15,13 @@ def threading_function(function_name: callable, args=(), kwargs=None, name=None)
     except Exception as e:
         journal.send(f"Error starting thread for '{function_name.__name__}': {e}")
         raise RuntimeError(f"Failed to start thread '{thread_name}'") from e
+
+def _tracked(function_name, thread_name, args, kwargs):
+    metrics.thread_state(thread_name, True)
+    try:
+        function_name(*args, **kwargs)
+    except Exception as e:
+        journal.send(f"Thread '{thread_name}' crashed: {e}")
+        raise
+    finally:
+        metrics.thread_state(thread_name, False)